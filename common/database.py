@@ -0,0 +1,106 @@
+# One ArangoDB client per process. Its requests go through a pooled
+# keep-alive session that retries transient errors and reports the time
+# of every request to the registered hooks.
+#
+# The services are built from the repository root and this module is
+# copied next to the code of each of them, where it reads the server and
+# the read timeout from the service's config.
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from arango import ArangoClient
+from arango.http import HTTPClient
+from arango.response import Response
+import config
+
+POOL_SIZE = int(os.environ.get('BN_ARANGO_POOL_SIZE', 10))
+CONNECT_TIMEOUT = float(os.environ.get('BN_ARANGO_CONNECT_TIMEOUT', 10))
+RETRIES = int(os.environ.get('BN_ARANGO_RETRIES', 3))
+RETRY_BACKOFF = 0.5
+# documents fetched in each round trip of streaming cursors
+BATCH_SIZE = int(os.environ.get('BN_ARANGO_BATCH_SIZE', 1000))
+CURSOR_TTL = 600
+# only requests that are safe to send again are retried after a response
+# is lost; the ones that failed to connect are retried whatever they are
+RETRY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+# called with method, url, status code and seconds of each request
+hooks = []
+
+
+def create_session():
+    kwargs = {
+        'total': RETRIES,
+        'backoff_factor': RETRY_BACKOFF,
+        'status_forcelist': [503],
+        'raise_on_status': False
+    }
+    try:
+        retry = Retry(allowed_methods=RETRY_METHODS, **kwargs)
+    except TypeError:
+        # urllib3 before 1.26
+        retry = Retry(method_whitelist=RETRY_METHODS, **kwargs)
+    adapter = HTTPAdapter(pool_connections=1,
+                          pool_maxsize=POOL_SIZE,
+                          max_retries=retry)
+    s = requests.Session()
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    return s
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT,
+                                  config.ARANGO_READ_TIMEOUT))
+    start = time.time()
+    r = session.request(method, url, **kwargs)
+    seconds = time.time() - start
+    for hook in hooks:
+        hook(method, url, r.status_code, seconds)
+    return r
+
+
+class PooledHTTPClient(HTTPClient):
+
+    def create_session(self, host):
+        return session
+
+    def send_request(self, session, method, url, params=None, data=None,
+                     headers=None, auth=None):
+        r = request(method, url, params=params, data=data, headers=headers,
+                    auth=auth)
+        return Response(
+            method=r.request.method,
+            url=r.url,
+            headers=r.headers,
+            status_code=r.status_code,
+            status_text=r.reason,
+            raw_body=r.text,
+        )
+
+
+session = create_session()
+client = ArangoClient(hosts=config.ARANGO_SERVER,
+                      http_client=PooledHTTPClient())
+
+
+def db(name='_system'):
+    return client.db(name)
+
+
+def query(database, q, bind_vars=None, **kwargs):
+    # runs the query as a streaming cursor that fetches batch_size
+    # documents at a time instead of building the whole result first
+    kwargs.setdefault('batch_size', BATCH_SIZE)
+    kwargs.setdefault('ttl', CURSOR_TTL)
+    return database.aql.execute(q, bind_vars=bind_vars, stream=True, **kwargs)
+
+
+def ensure_indexes(name, indexes):
+    # creates the persistent indexes that the queries of the service rely
+    # on; an index that already exists is left as it is
+    database = db(name)
+    for collection, fields in indexes:
+        if database.has_collection(collection):
+            database[collection].add_persistent_index(fields)
@@ -0,0 +1,68 @@
+# Bases of the tests that need a running ArangoDB at config.ARANGO_SERVER.
+# Each test class gets its own temporary database, and the tests are
+# skipped when the server can not be reached.
+import random
+import string
+import unittest
+import config
+import database
+
+
+def explain(name, query, bind_vars):
+    # python-arango's explain does not take bind vars
+    url = f'{config.ARANGO_SERVER}/_db/{name}/_api/explain'
+    r = database.request('post', url, json={
+        'query': query,
+        'bindVars': bind_vars
+    })
+    r.raise_for_status()
+    return r.json()['plan']['nodes']
+
+
+def full_scans(name, query, bind_vars):
+    return [n['collection'] for n in explain(name, query, bind_vars)
+            if n['type'] == 'EnumerateCollectionNode']
+
+
+class TemporaryDatabase:
+    # mixed into unittest.TestCase classes; collections maps the names of
+    # the collections to create to whether they are edge collections and
+    # indexes lists the (collection, fields) indexes to create
+    collections = {}
+    indexes = []
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            database.db('_system').version()
+        except Exception as e:
+            raise unittest.SkipTest(
+                f'ArangoDB is not available at {config.ARANGO_SERVER}: {e}')
+        suffix = ''.join(random.choices(string.ascii_lowercase, k=8))
+        cls.name = f'test_{suffix}'
+        database.db('_system').create_database(cls.name)
+        cls.db = database.db(cls.name)
+        for collection, edge in cls.collections.items():
+            cls.db.create_collection(collection, edge=edge)
+        database.ensure_indexes(cls.name, cls.indexes)
+
+    @classmethod
+    def tearDownClass(cls):
+        database.db('_system').delete_database(cls.name)
+
+
+class IndexTests(TemporaryDatabase):
+    # queries lists the (query, bind vars) of the service's modules that
+    # must be answered from indexes without scanning a whole collection
+    queries = []
+
+    def test_ensure_indexes_twice(self):
+        counts = {c: len(self.db[c].indexes()) for c in self.collections}
+        database.ensure_indexes(self.name, self.indexes)
+        self.assertEqual(
+            {c: len(self.db[c].indexes()) for c in self.collections}, counts)
+
+    def test_queries(self):
+        for query, bind_vars in self.queries:
+            with self.subTest(query=query):
+                self.assertEqual(full_scans(self.name, query, bind_vars), [])
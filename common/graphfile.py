@@ -0,0 +1,147 @@
+import sys
+import mmap
+import struct
+from array import array
+
+# graph.bin layout (little-endian, every section 8-byte aligned):
+# header: magic, version, number of sections
+# section table: (offset, length in bytes) for each of SECTIONS
+# users and seed groups are interned as indexes into sorted key tables
+# and connections are stored as columns sorted by (from, to)
+#
+# The consensus receiver writes it next to each snapshot and the scorer
+# reads it.
+MAGIC = b'BIDG'
+VERSION = 1
+HEADER = struct.Struct('<4sII')
+SECTION = struct.Struct('<QQ')
+SECTIONS = [
+    'user_offsets', 'user_keys',
+    'conn_from', 'conn_to', 'conn_timestamp', 'conn_level',
+    'group_offsets', 'group_keys',
+    'member_user', 'member_group'
+]
+# array typecodes of the sections that are not raw bytes
+FORMATS = {
+    'user_offsets': 'I',
+    'conn_from': 'I',
+    'conn_to': 'I',
+    'conn_timestamp': 'Q',
+    'conn_level': 'B',
+    'group_offsets': 'I',
+    'member_user': 'I',
+    'member_group': 'I',
+}
+LEVELS = ['reported', 'suspicious', 'just met', 'already known', 'recovery']
+UNKNOWN_LEVEL = 255
+
+
+def to_bytes(name, values):
+    a = array(FORMATS[name], values)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a.tobytes()
+
+
+def pack_keys(name, keys):
+    offsets = [0]
+    blob = bytearray()
+    for key in keys:
+        blob += key.encode('utf-8')
+        offsets.append(len(blob))
+    return to_bytes(name, offsets), bytes(blob)
+
+
+def write(fpath, users, connections, seed_groups, memberships):
+    # connections are (from, to, level, timestamp) and memberships are
+    # (user, group) by key; every connection is kept like the queries of
+    # the snapshot database do, so users that are only referenced by a
+    # connection or a membership are added to the user table
+    assert array('I').itemsize == 4, 'unsigned int is not 4 bytes'
+    connections = list(connections)
+    memberships = list(memberships)
+    users = set(users)
+    users.update(c[0] for c in connections)
+    users.update(c[1] for c in connections)
+    users.update(m[0] for m in memberships)
+    users = sorted(users)
+    user_ids = {u: i for i, u in enumerate(users)}
+    connections = sorted(
+        (user_ids[f], user_ids[t],
+         LEVELS.index(l) if l in LEVELS else UNKNOWN_LEVEL, ts)
+        for f, t, l, ts in connections
+    )
+    seed_groups = sorted(seed_groups)
+    group_ids = {g: i for i, g in enumerate(seed_groups)}
+    members = sorted(
+        (user_ids[u], group_ids[g])
+        for u, g in memberships
+        if g in group_ids
+    )
+
+    sections = {}
+    sections['user_offsets'], sections['user_keys'] = pack_keys(
+        'user_offsets', users)
+    sections['conn_from'] = to_bytes('conn_from', (c[0] for c in connections))
+    sections['conn_to'] = to_bytes('conn_to', (c[1] for c in connections))
+    sections['conn_level'] = to_bytes(
+        'conn_level', (c[2] for c in connections))
+    sections['conn_timestamp'] = to_bytes(
+        'conn_timestamp', (c[3] for c in connections))
+    sections['group_offsets'], sections['group_keys'] = pack_keys(
+        'group_offsets', seed_groups)
+    sections['member_user'] = to_bytes('member_user', (m[0] for m in members))
+    sections['member_group'] = to_bytes(
+        'member_group', (m[1] for m in members))
+
+    offset = HEADER.size + SECTION.size * len(SECTIONS)
+    table = []
+    for name in SECTIONS:
+        offset += -offset % 8
+        table.append((offset, len(sections[name])))
+        offset += len(sections[name])
+    with open(fpath, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(SECTIONS)))
+        for entry in table:
+            f.write(SECTION.pack(*entry))
+        for name, (offset, length) in zip(SECTIONS, table):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(sections[name])
+
+
+class Graph:
+    # the sections are memoryviews over the mapped file so nothing
+    # is copied until a value is read
+
+    def __init__(self, fpath):
+        if sys.byteorder == 'big':
+            raise ValueError('graph files can not be mapped on big-endian hosts')
+        with open(fpath, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mm)
+        magic, version, count = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION or count != len(SECTIONS):
+            raise ValueError(f'{fpath} is not a supported graph file')
+        for i, name in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(
+                buf, HEADER.size + i * SECTION.size)
+            section = buf[offset:offset + length]
+            if name in FORMATS:
+                section = section.cast(FORMATS[name])
+            setattr(self, name, section)
+
+    @property
+    def num_users(self):
+        return len(self.user_offsets) - 1
+
+    @property
+    def num_connections(self):
+        return len(self.conn_from)
+
+    def user(self, i):
+        start, end = self.user_offsets[i], self.user_offsets[i + 1]
+        return bytes(self.user_keys[start:end]).decode('utf-8')
+
+    def group(self, i):
+        start, end = self.group_offsets[i], self.group_offsets[i + 1]
+        return bytes(self.group_keys[start:end]).decode('utf-8')
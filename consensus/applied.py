@@ -0,0 +1,157 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+import collections
+import config
+
+log = logging.getLogger('applied')
+
+
+class BloomFilter:
+
+    def __init__(self, size, hashes, bits=None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray(size // 8)
+
+    def _positions(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 4:i * 4 + 4], 'little') % self.size
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p // 8] |= 1 << (p % 8)
+
+    def __contains__(self, key):
+        return all(self.bits[p // 8] & (1 << (p % 8))
+                   for p in self._positions(key))
+
+
+# the lru holds the exact latest hashes and the two bloom filter
+# generations remember older ones with a small false positive rate
+db_id = None
+lru = collections.OrderedDict()
+current = BloomFilter(config.APPLIED_BLOOM_BITS, config.APPLIED_BLOOM_HASHES)
+previous = BloomFilter(config.APPLIED_BLOOM_BITS, config.APPLIED_BLOOM_HASHES)
+count = 0
+journal = None
+# the journal is flushed after each block, so the hashes of a block that
+# was being processed when the receiver stopped may be missing from it
+unsure = False
+
+
+def journal_path():
+    return config.APPLIED_INDEX_PATH + '.journal'
+
+
+def reset():
+    global lru, current, previous, count
+    lru = collections.OrderedDict()
+    current = BloomFilter(config.APPLIED_BLOOM_BITS,
+                          config.APPLIED_BLOOM_HASHES)
+    previous = BloomFilter(config.APPLIED_BLOOM_BITS,
+                           config.APPLIED_BLOOM_HASHES)
+    count = 0
+
+
+def remember(h):
+    global current, previous, count
+    lru[h] = True
+    lru.move_to_end(h)
+    if len(lru) > config.APPLIED_LRU_SIZE:
+        lru.popitem(last=False)
+    current.add(h)
+    count += 1
+    if count >= config.APPLIED_BLOOM_CAPACITY:
+        previous = current
+        current = BloomFilter(config.APPLIED_BLOOM_BITS,
+                              config.APPLIED_BLOOM_HASHES)
+        count = 0
+
+
+def read_journal(database_id):
+    try:
+        with open(journal_path()) as f:
+            if f.readline().strip() != f'db:{database_id}':
+                return
+            for line in f:
+                if line.strip():
+                    remember(line.strip())
+    except FileNotFoundError:
+        pass
+
+
+def load(database_id):
+    # the index is only valid for the database it was built on and
+    # is discarded when the database is recreated
+    global db_id, count, unsure
+    reset()
+    db_id = database_id
+    unsure = True
+    try:
+        with open(config.APPLIED_INDEX_PATH) as f:
+            state = json.load(f)
+        if state['db'] == database_id:
+            current.bits = bytearray(base64.b64decode(state['current']))
+            previous.bits = bytearray(base64.b64decode(state['previous']))
+            count = state['count']
+            for h in state['lru']:
+                lru[h] = True
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.error(f'Error in loading applied operations index: {e}')
+        reset()
+    read_journal(database_id)
+    log.info(f'applied operations index loaded with {len(lru)} recent hashes')
+    checkpoint()
+
+
+def add(h):
+    remember(h)
+    if journal:
+        journal.write(h + '\n')
+
+
+def flush():
+    # called when a block is processed
+    global unsure
+    if journal:
+        journal.flush()
+    unsure = False
+
+
+def checkpoint():
+    global journal
+    if db_id is None:
+        return
+    tmp = config.APPLIED_INDEX_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({
+            'db': db_id,
+            'count': count,
+            'current': base64.b64encode(current.bits).decode('ascii'),
+            'previous': base64.b64encode(previous.bits).decode('ascii'),
+            'lru': list(lru.keys())
+        }, f)
+    os.replace(tmp, config.APPLIED_INDEX_PATH)
+    if journal:
+        journal.close()
+    journal = open(journal_path(), 'w')
+    journal.write(f'db:{db_id}\n')
+    journal.flush()
+
+
+def find(hashes, confirm):
+    # returns the hashes that are applied before; bloom filter hits are
+    # confirmed by the confirm callback because they may be false positives
+    # and all hashes are confirmed until the first block is processed
+    done = set(h for h in hashes if h in lru)
+    maybe = [h for h in hashes if h not in done and (
+        unsure or h in current or h in previous)]
+    if maybe:
+        done.update(confirm(maybe))
+    return done
@@ -1,4 +1,5 @@
 import os
+import logging
 import hashlib
 from eth_keys import keys
 from eth_utils import decode_hex
@@ -26,7 +27,102 @@ BN_ARANGO_HOST = os.environ['BN_ARANGO_HOST']
 BN_ARANGO_PORT = int(os.environ['BN_ARANGO_PORT'])
 ARANGO_SERVER = f'{BN_ARANGO_PROTOCOL}://{BN_ARANGO_HOST}:{BN_ARANGO_PORT}'
 
+# seconds to wait for a response of ArangoDB; there is no read timeout by
+# default because replication dumps of large collections stream for long
+ARANGO_READ_TIMEOUT = float(os.environ['BN_ARANGO_READ_TIMEOUT']) \
+    if os.environ.get('BN_ARANGO_READ_TIMEOUT') else None
+# persistent indexes as (collection, fields) that the queries of the receiver
+# and the sender rely on; they are created at startup if they do not exist
+INDEXES = [
+    ('operations', ['state', 'timestamp']),
+    ('operations', ['timestamp']),
+]
+
 APPLY_URL = ARANGO_SERVER + os.environ['BN_CONSENSUS_APPLY_URL']
 DUMP_URL = ARANGO_SERVER + os.environ['BN_CONSENSUS_DUMP_URL']
 
-IDCHAIN_RPC_URL = os.environ['BN_CONSENSUS_IDCHAIN_RPC_URL']
\ No newline at end of file
+IDCHAIN_RPC_URL = os.environ['BN_CONSENSUS_IDCHAIN_RPC_URL']
+
+# seconds to wait for a newHeads notification before polling the latest block
+HEAD_WAIT_TIMEOUT = int(os.environ.get('BN_CONSENSUS_HEAD_WAIT_TIMEOUT', 5))
+HEADS_RECONNECT_INTERVAL = int(
+    os.environ.get('BN_CONSENSUS_HEADS_RECONNECT_INTERVAL', 5))
+SEALERS_REFRESH_INTERVAL = int(
+    os.environ.get('BN_CONSENSUS_SEALERS_REFRESH_INTERVAL', 600))
+SEALERS_RETRY_INTERVAL = 5
+GET_BLOCK_RETRIES = 5
+GET_BLOCK_RETRY_DELAY = 0.5
+
+BATCH_URL = ARANGO_SERVER + '/_api/replication/batch'
+INVENTORY_URL = ARANGO_SERVER + '/_api/replication/inventory'
+# seconds the database keeps a dump batch alive without being touched
+DUMP_BATCH_TTL = 600
+# the batch of the last snapshot is kept alive up to BASE_BATCH_TTL seconds
+# so the write-ahead log is kept until the next snapshot tails it; the
+# replication client id the dumper registers with is DUMP_SERVER_ID
+BASE_BATCH_TTL = int(os.environ.get('BN_CONSENSUS_BASE_BATCH_TTL', 7200))
+DUMP_SERVER_ID = os.environ.get('BN_CONSENSUS_DUMP_SERVER_ID', '1')
+DUMP_CHUNK_SIZE = 16 * 1024 * 1024
+WAL_TAIL_URL = ARANGO_SERVER + '/_api/wal/tail'
+# a full dump is taken every SNAPSHOTS_FULL_PERIODS snapshots and the
+# snapshots in between only store the changes since the previous one
+SNAPSHOTS_FULL_PERIODS = int(
+    os.environ.get('BN_CONSENSUS_SNAPSHOTS_FULL_PERIODS', 6))
+
+# old operations are removed in chunks with a pause in between
+# to not compete with applying new operations
+OPERATIONS_EXPIRY_CHUNK = int(
+    os.environ.get('BN_CONSENSUS_OPERATIONS_EXPIRY_CHUNK', 1000))
+OPERATIONS_EXPIRY_DELAY = float(
+    os.environ.get('BN_CONSENSUS_OPERATIONS_EXPIRY_DELAY', 0.5))
+
+LOG_LEVEL = os.environ.get('BN_CONSENSUS_LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(
+    level=LOG_LEVEL, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+# ports of the local metrics endpoints, 0 disables them
+RECEIVER_METRICS_PORT = int(
+    os.environ.get('BN_CONSENSUS_RECEIVER_METRICS_PORT', 9101))
+SENDER_METRICS_PORT = int(
+    os.environ.get('BN_CONSENSUS_SENDER_METRICS_PORT', 9102))
+
+# index of recently applied operations that lets the receiver skip
+# re-sending them to the apply service after a restart
+APPLIED_INDEX_PATH = os.environ.get(
+    'BN_CONSENSUS_APPLIED_INDEX_PATH', '/snapshots/applied_index')
+APPLIED_LRU_SIZE = 100000
+APPLIED_BLOOM_BITS = 8 * 1024 * 1024
+APPLIED_BLOOM_HASHES = 7
+# number of hashes added to a bloom filter before it is rotated
+APPLIED_BLOOM_CAPACITY = 500000
+# number of blocks between writing the index and truncating its journal
+APPLIED_INDEX_CHECKPOINT = 100
+
+# number of oldest queued operations the sender considers for a transaction
+PACKING_CANDIDATES = int(
+    os.environ.get('BN_CONSENSUS_PACKING_CANDIDATES', 5000))
+# fields of operations that hold the users, groups and apps they depend on;
+# operations sharing one of them with a skipped operation are not packed
+# before it
+REFERENCE_FIELDS = ['id', 'id1', 'id2', 'id3', 'id4', 'id5', 'group',
+                    'inviter', 'invitee', 'dismisser', 'dismissee', 'admin',
+                    'head', 'app', 'appUserId', 'contextId']
+
+# compressed payloads can only be enabled when every node runs a receiver
+# that understands them
+COMPRESS_PAYLOAD = os.environ.get(
+    'BN_CONSENSUS_COMPRESS_PAYLOAD', 'false').lower() == 'true'
+
+# number of sent transactions that may wait to be mined at the same time
+MAX_PENDING_TRANSACTIONS = int(
+    os.environ.get('BN_CONSENSUS_MAX_PENDING_TRANSACTIONS', 4))
+# the sender checks for changes in the operations collection starting
+# every SENDER_POLL_INTERVAL seconds and backing off up to every
+# SENDER_MAX_POLL_INTERVAL seconds, and rechecks pending transactions at
+# least every SENDER_IDLE_TIMEOUT seconds
+SENDER_POLL_INTERVAL = 0.1
+SENDER_MAX_POLL_INTERVAL = 2
+SENDER_IDLE_TIMEOUT = 5
+# seconds without a mined transaction while some are pending before the
+# nonce is reloaded from the pending transactions count of the chain
+NONCE_RESYNC_TIMEOUT = int(
+    os.environ.get('BN_CONSENSUS_NONCE_RESYNC_TIMEOUT', 120))
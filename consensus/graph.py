@@ -0,0 +1,90 @@
+import json
+import graphfile
+
+# replication marker type of documents in dump files
+DOCUMENT_MARKER = 2300
+
+# the graph of the last saved snapshot that deltas are applied to, so the
+# graph.bin sidecar (see common/graphfile.py) of a delta snapshot is built
+# without reading the full dump again
+state = None
+
+
+def new_state():
+    return {'users': set(), 'connections': {}, 'groups': {}, 'memberships': {}}
+
+
+def add(s, collection, doc):
+    key = doc['_key']
+    if collection == 'users':
+        s['users'].add(key)
+    elif collection == 'connections':
+        s['connections'][key] = (
+            doc['_from'].split('/', 1)[1],
+            doc['_to'].split('/', 1)[1],
+            doc.get('level'),
+            int(doc.get('timestamp') or 0)
+        )
+    elif collection == 'groups':
+        # like the `seed == true` filter of the scorer's queries
+        s['groups'][key] = doc.get('seed') is True
+    elif collection == 'usersInGroups':
+        s['memberships'][key] = (
+            doc['_from'].split('/', 1)[1],
+            doc['_to'].split('/', 1)[1]
+        )
+
+
+def remove(s, collection, key):
+    if collection == 'users':
+        s['users'].discard(key)
+    elif collection == 'connections':
+        s['connections'].pop(key, None)
+    elif collection == 'groups':
+        s['groups'].pop(key, None)
+    elif collection == 'usersInGroups':
+        s['memberships'].pop(key, None)
+
+
+def read_lines(fpath):
+    with open(fpath) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_dump(data_files):
+    global state
+    state = None
+    s = new_state()
+    for collection, fpath in data_files.items():
+        for doc in read_lines(fpath):
+            # dump api wraps documents in replication markers
+            if 'type' in doc and 'data' in doc:
+                if doc['type'] != DOCUMENT_MARKER:
+                    continue
+                doc = doc['data']
+            add(s, collection, doc)
+    state = s
+
+
+def apply_delta(delta_files):
+    if state is None:
+        raise Exception('there is no base graph to apply the delta to')
+    for collection, fpath in delta_files.items():
+        for change in read_lines(fpath):
+            if change['type'] == 'remove':
+                remove(state, collection, change['key'])
+            else:
+                add(state, collection, change['data'])
+
+
+def save(fpath):
+    graphfile.write(
+        fpath,
+        state['users'],
+        state['connections'].values(),
+        [g for g, seed in state['groups'].items() if seed],
+        state['memberships'].values()
+    )
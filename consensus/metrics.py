@@ -0,0 +1,116 @@
+import time
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.9, 0.99)
+# quantiles are computed over this many latest observations
+WINDOW = 1024
+
+registry = []
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [(self.name, self.value)]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class Summary:
+    type = 'summary'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.count = 0
+        self.sum = 0
+        self.window = collections.deque(maxlen=WINDOW)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self.window.append(value)
+
+    def time(self):
+        return Timer(self)
+
+    def samples(self):
+        with self._lock:
+            window = sorted(self.window)
+            res = []
+            for q in QUANTILES:
+                value = window[int(q * (len(window) - 1))] if window else 0
+                res.append((f'{self.name}{{quantile="{q}"}}', value))
+            res.append((f'{self.name}_sum', self.sum))
+            res.append((f'{self.name}_count', self.count))
+        return res
+
+
+class Timer:
+
+    def __init__(self, summary):
+        self.summary = summary
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.summary.observe(time.time() - self.start)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, value in metric.samples():
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    # port 0 disables the endpoint
+    if not port:
+        return
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
@@ -0,0 +1,59 @@
+import zlib
+import json
+
+# compressed payloads start with MAGIC and a version byte followed by raw
+# deflate data compressed with the preset dictionary of that version.
+# MAGIC can not start a json document so legacy payloads are told apart
+MAGIC = b'\xb1\xd1'
+VERSION = 1
+# the dictionaries must never change because transactions that are already
+# on chain are encoded with them; add a new version instead.
+# strings near the end of a dictionary are the cheapest to reference
+DICTIONARIES = {
+    1: (
+        '"requiredRecoveryNum": "spammer", "fake", "duplicate", "deceased", '
+        '"replaced", "other", "reportReason": "requestProof": "inviteData2": '
+        '"Set Required Recovery Num", "Convert To Family", "Set Family Head", '
+        '"Vouch Family", "Remove All Signing Keys", "Remove Signing Key", '
+        '"Add Signing Key", "Update Group", "Add Admin", "Dismiss", "Invite", '
+        '"Spend Sponsorship", "Remove Membership", "Remove Group", '
+        '"Link ContextId", "contextId": "context": "type": "general", '
+        '"family", "head": "inviter": "invitee": "url": "data": '
+        '"Social Recovery", "signingKey": "sig2": "id2": "Add Group", '
+        '"Sponsor", "app": "appUserId": "Add Membership", "group": '
+        '"level": "suspicious", "reported", "recovery", "already known", '
+        '"just met", "sig": "id": "Connect", "id1": "sig1": '
+        '"timestamp": 16, "v": 6}, {"name": '
+    ).encode('utf-8'),
+}
+# decoding stops beyond this size to not be exhausted by a malicious payload
+MAX_DECODED_SIZE = 16 * 1024 * 1024
+
+
+def is_encoded(data):
+    return data[:len(MAGIC)] == MAGIC
+
+
+def encode(operations, version=VERSION):
+    message = json.dumps(operations).encode('utf-8')
+    compressor = zlib.compressobj(
+        level=9, wbits=-15, zdict=DICTIONARIES[version])
+    compressed = compressor.compress(message) + compressor.flush()
+    return MAGIC + bytes([version]) + compressed
+
+
+def decode(data):
+    if not is_encoded(data) or len(data) <= len(MAGIC):
+        raise ValueError('not an encoded payload')
+    version = data[len(MAGIC)]
+    if version not in DICTIONARIES:
+        raise ValueError(f'unknown payload version {version}')
+    decompressor = zlib.decompressobj(wbits=-15, zdict=DICTIONARIES[version])
+    try:
+        message = decompressor.decompress(
+            data[len(MAGIC) + 1:], MAX_DECODED_SIZE)
+    except zlib.error as e:
+        raise ValueError(f'invalid compressed payload: {e}')
+    if decompressor.unconsumed_tail:
+        raise ValueError('decoded payload is too large')
+    return json.loads(message.decode('utf-8'))
@@ -1,23 +1,62 @@
-import os
 import time
 import socket
+import logging
 import json
+import asyncio
+import threading
 import base64
 import hashlib
-import shutil
 import requests
 import traceback
-from arango import ArangoClient, errno
+import websockets
+from arango import errno
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
 import config
+import applied
+import database
+import metrics
+import payload
+import snapshots
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
+log = logging.getLogger('receiver')
+
+db = database.db('_system')
 w3 = Web3(Web3.WebsocketProvider(config.INFURA_URL))
 if config.INFURA_URL.count('rinkeby') > 0 or config.INFURA_URL.count('idchain') > 0:
     w3.middleware_onion.inject(geth_poa_middleware, layer=0)
 
 NUM_SEALERS = 0
+HEAD = 0
+new_head = threading.Event()
+expirer = None
+
+blocks_total = metrics.Counter(
+    'receiver_blocks_total', 'Number of processed blocks')
+operations_total = metrics.Counter(
+    'receiver_operations_total', 'Number of operations sent to apply service')
+failed_operations_total = metrics.Counter(
+    'receiver_failed_operations_total', 'Number of operations failed to apply')
+invalid_operations_total = metrics.Counter(
+    'receiver_invalid_operations_total', 'Number of invalid operations')
+skipped_operations_total = metrics.Counter(
+    'receiver_skipped_operations_total',
+    'Number of operations skipped because they are applied before')
+conflict_retries_total = metrics.Counter(
+    'receiver_conflict_retries_total', 'Number of retries on write conflicts')
+apply_seconds = metrics.Summary(
+    'receiver_apply_seconds', 'Time to apply an operation')
+block_seconds = metrics.Summary(
+    'receiver_block_seconds', 'Time to process a block')
+head_block = metrics.Gauge('receiver_head_block', 'Latest known chain head')
+last_block_gauge = metrics.Gauge(
+    'receiver_last_block', 'Last processed block')
+lag_blocks = metrics.Gauge(
+    'receiver_lag_blocks', 'Number of blocks LAST_BLOCK trails the chain head')
+arango_seconds = metrics.Summary(
+    'receiver_arango_request_seconds', 'Time of a request to ArangoDB')
+database.hooks.append(
+    lambda method, url, status, seconds: arango_seconds.observe(seconds))
 
 
 def hash(op):
@@ -38,111 +77,253 @@ def hash(op):
     return h.replace('+', '-').replace('/', '_').replace('=', '')
 
 
+def parse(data):
+    # hex may end with zeros so only the prefix should be removed
+    if data.startswith('0x'):
+        data = data[2:]
+    data_bytes = bytes.fromhex(data)
+    if payload.is_encoded(data_bytes):
+        return payload.decode(data_bytes)
+    # legacy json may be padded with zero bytes that strip('0x') removed
+    data_str = data_bytes.rstrip(b'\x00').decode('utf-8', 'ignore')
+    return json.loads(data_str)
+
+
 def process(data, block_timestamp):
-    data_bytes = bytes.fromhex(data.strip('0x'))
-    data_str = data_bytes.decode('utf-8', 'ignore')
     try:
-        operations = json.loads(data_str)
+        operations = parse(data)
     except ValueError as e:
-        print('error in parsing operations', data_str)
+        log.error('error in parsing operations %s: %s', data, e)
+        invalid_operations_total.inc()
+        return
+    if type(operations) != list:
+        log.error('invalid operations %s', operations)
+        invalid_operations_total.inc()
         return
+    valids = []
     for op in operations:
         if type(op) != dict or op.get('v') not in (5, 6) or 'name' not in op:
-            print('invalid operation', op)
+            log.warning('invalid operation %s', op)
+            invalid_operations_total.inc()
             continue
         op['blockTime'] = block_timestamp * 1000
-        process_op(op)
+        valids.append(op)
+    hashes = [hash(op) for op in valids]
+    done = applied.find(hashes, confirm_applied)
+    for op, h in zip(valids, hashes):
+        if h in done:
+            log.debug(f'skipping {h} that is applied before')
+            skipped_operations_total.inc()
+            continue
+        process_op(op, h)
 
 
-def process_op(op):
-    print(op)
-    url = config.APPLY_URL.format(v=op['v'], hash=hash(op))
-    r = requests.put(url, json=op)
+def confirm_applied(hashes):
+    # failed operations are final too unless they failed on a conflict
+    # that was going to be retried
+    return db.aql.execute('''
+        FOR h IN @hashes
+            LET o = DOCUMENT('operations', h)
+            FILTER o.state == 'applied' OR (
+                o.state == 'failed' AND o.result.arangoErrorNum != @conflict
+            )
+            RETURN h
+    ''', bind_vars={'hashes': hashes, 'conflict': errno.CONFLICT})
+
+
+def process_op(op, h=None):
+    log.debug(op)
+    h = h or hash(op)
+    url = config.APPLY_URL.format(v=op['v'], hash=h)
+    with apply_seconds.time():
+        r = database.request('put', url, json=op)
+    operations_total.inc()
     resp = r.json()
-    print(resp)
+    log.debug(resp)
     # resp is returned from PUT /operations handler
     if resp.get('state') == 'failed':
         if resp['result'].get('arangoErrorNum') == errno.CONFLICT:
-            print('retry on conflict')
-            return process_op(op)
+            log.info('retry on conflict')
+            conflict_retries_total.inc()
+            return process_op(op, h)
+        failed_operations_total.inc()
     # resp is returned from arango not PUT /operations handler
     # joi errors (bad request errors) have code 400
     if resp.get('error') and resp.get('code') != 400:
         raise Exception('Error from apply service')
+    applied.add(h)
 
 
-def save_snapshot(block):
-    dir_name = config.SNAPSHOTS_PATH.format(block)
-    fnl_dir_name = f'{dir_name}_fnl'
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    collections_file = os.path.join(dir_path, 'collections.json')
-    res = os.system(
-        f'arangodump --overwrite true --compress-output false --server.password "" --server.endpoint "tcp://{config.BN_ARANGO_HOST}:{config.BN_ARANGO_PORT}" --output-directory {dir_name} --maskings {collections_file}')
-    assert res == 0, "dumping snapshot failed"
-    shutil.move(dir_name, fnl_dir_name)
+def process_block(block):
+    for tx in block['transactions']:
+        if tx['to'] and tx['to'].lower() in (config.TO_ADDRESS.lower(), config.DEPRECATED_TO_ADDRESS.lower()):
+            process(tx['input'], block['timestamp'])
 
 
 def update_num_sealers():
     global NUM_SEALERS
     data = {'jsonrpc': '2.0', 'method': 'clique_status', 'params': [], 'id': 1}
     headers = {'Content-Type': 'application/json', 'Cache-Control': 'no-cache'}
-    try:
-        resp = requests.post(config.IDCHAIN_RPC_URL,
-                             json=data, headers=headers)
-        NUM_SEALERS = len(resp.json()['result']['sealerActivity'])
-    except Exception as e:
-        print('Error from update_num_sealers', e)
-        update_num_sealers()
+    resp = requests.post(config.IDCHAIN_RPC_URL, json=data, headers=headers)
+    NUM_SEALERS = len(resp.json()['result']['sealerActivity'])
 
 
-def remove_old_operations():
-    print('Removing operations older than 30 days')
-    border = int(time.time() * 1000) - 30 * 24 * 60 * 60 * 1000
-    print(border)
-    db.aql.execute('''
+def sealers_updater():
+    while True:
+        try:
+            update_num_sealers()
+        except Exception as e:
+            log.error('Error from update_num_sealers %s', e)
+            time.sleep(config.SEALERS_RETRY_INTERVAL)
+            continue
+        time.sleep(config.SEALERS_REFRESH_INTERVAL)
+
+
+async def subscribe_heads():
+    global HEAD
+    async with websockets.connect(config.INFURA_URL) as ws:
+        await ws.send(json.dumps({
+            'jsonrpc': '2.0',
+            'method': 'eth_subscribe',
+            'params': ['newHeads'],
+            'id': 1
+        }))
+        resp = json.loads(await ws.recv())
+        if 'error' in resp:
+            raise Exception(f'newHeads subscription failed: {resp["error"]}')
+        while True:
+            msg = json.loads(await ws.recv())
+            number = int(msg['params']['result']['number'], 16)
+            if number > HEAD:
+                HEAD = number
+                new_head.set()
+
+
+def heads_listener():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    while True:
+        try:
+            loop.run_until_complete(subscribe_heads())
+        except Exception as e:
+            log.error('Error from newHeads subscription %s', e)
+        time.sleep(config.HEADS_RECONNECT_INTERVAL)
+
+
+def start_trackers():
+    # the first sealers count is needed before confirming any block
+    while True:
+        try:
+            update_num_sealers()
+            break
+        except Exception as e:
+            log.error('Error from update_num_sealers %s', e)
+            time.sleep(config.SEALERS_RETRY_INTERVAL)
+    threading.Thread(target=sealers_updater, daemon=True).start()
+    threading.Thread(target=heads_listener, daemon=True).start()
+
+
+def wait_for_head(last_head):
+    new_head.wait(config.HEAD_WAIT_TIMEOUT)
+    new_head.clear()
+    if HEAD > last_head:
+        return HEAD
+    # no notification arrived in time; the subscription may be down
+    # so fall back to asking the node directly
+    return max(HEAD, w3.eth.getBlock('latest').number)
+
+
+def get_block(block_number):
+    # the node may fail to return the transactions of a block that is
+    # just announced, so retry shortly instead of sleeping on every block
+    for i in range(config.GET_BLOCK_RETRIES):
+        try:
+            block = w3.eth.getBlock(block_number, True)
+            if block is not None:
+                return block
+        except Exception as e:
+            log.warning(f'Error in getting block {block_number}: {e}')
+        time.sleep(config.GET_BLOCK_RETRY_DELAY * (i + 1))
+    return w3.eth.getBlock(block_number, True)
+
+
+REMOVE_OLD_OPERATIONS = '''
+    LET removed = (
         FOR o IN operations
             FILTER  o.timestamp < @border
-            REMOVE o IN operations
-        ''', bind_vars={'border': border})
+            LIMIT @limit
+            REMOVE { _key: o._key } IN operations
+            OPTIONS { ignoreErrors: true }
+            RETURN 1
+    )
+    RETURN LENGTH(removed)
+'''
+
+
+def remove_old_operations():
+    log.info('Removing operations older than 30 days')
+    border = int(time.time() * 1000) - 30 * 24 * 60 * 60 * 1000
+    total = 0
+    try:
+        while True:
+            removed = db.aql.execute(REMOVE_OLD_OPERATIONS, bind_vars={
+                'border': border,
+                'limit': config.OPERATIONS_EXPIRY_CHUNK
+            }).next()
+            total += removed
+            if removed < config.OPERATIONS_EXPIRY_CHUNK:
+                break
+            log.info(f'{total} old operations removed so far')
+            time.sleep(config.OPERATIONS_EXPIRY_DELAY)
+    except Exception as e:
+        log.error(f'Error in removing old operations: {e}')
+    log.info(f'{total} old operations removed')
+
+
+def expire_operations():
+    global expirer
+    # a removal that is still running will also cover this border
+    if expirer and expirer.is_alive():
+        return
+    expirer = threading.Thread(target=remove_old_operations, daemon=True)
+    expirer.start()
 
 
 def main():
-    update_num_sealers()
+    database.ensure_indexes('_system', config.INDEXES)
+    applied.load(db.collection('operationsHashes').properties()['id'])
     variables = db.collection('variables')
     last_block = variables.get('LAST_BLOCK')['value']
+    head = 0
 
     while True:
-        # This sleep is for not calling the ethereum node endpoint
-        # for getting the last block number more than once per second
-        time.sleep(1)
-        current_block = w3.eth.getBlock('latest').number
-        confirmed_block = current_block - (NUM_SEALERS // 2 + 1)
-
-        if confirmed_block > last_block:
-            # Here we should go to process the block imediately, but there seems
-            # to be a bug in getBlock that cause error when we get the transactions
-            # instantly. This delay is added to avoid that error.
-            # When error is raised, the file will run again and no bad problem occur.
-            time.sleep(3)
+        head = wait_for_head(head)
+        confirmed_block = head - (NUM_SEALERS // 2 + 1)
+        head_block.set(head)
+        lag_blocks.set(head - last_block)
 
         for block_number in range(last_block + 1, confirmed_block + 1):
-            print('processing block {}'.format(block_number))
-            if block_number % 100 == 0:
-                update_num_sealers()
-            block = w3.eth.getBlock(block_number, True)
-            for i, tx in enumerate(block['transactions']):
-                if tx['to'] and tx['to'].lower() in (config.TO_ADDRESS.lower(), config.DEPRECATED_TO_ADDRESS.lower()):
-                    process(tx['input'], block.timestamp)
+            log.info('processing block {}'.format(block_number))
+            start = time.time()
+            block = get_block(block_number)
+            process_block(block)
+            applied.flush()
             if block_number % config.SNAPSHOTS_PERIOD == 0:
-                save_snapshot(block_number)
+                snapshots.save_snapshot(block_number)
                 # PREV_SNAPSHOT_TIME is used by some verification
                 # algorithms to filter connections that are made
                 # after previous processed snapshot
                 variables.update(
                     {'_key': 'PREV_SNAPSHOT_TIME', 'value': block['timestamp']})
-                remove_old_operations()
+                expire_operations()
             variables.update({'_key': 'LAST_BLOCK', 'value': block_number})
             last_block = block_number
+            if block_number % config.APPLIED_INDEX_CHECKPOINT == 0:
+                applied.checkpoint()
+            block_seconds.observe(time.time() - start)
+            blocks_total.inc()
+            last_block_gauge.set(last_block)
+            lag_blocks.set(max(HEAD, head) - last_block)
 
 
 def wait():
@@ -153,33 +334,35 @@ def wait():
             (config.BN_ARANGO_HOST, config.BN_ARANGO_PORT))
         sock.close()
         if result != 0:
-            print('db is not running yet')
+            log.info('db is not running yet')
             continue
         # wait for ws to start upgrading foxx services and running setup script
         time.sleep(10)
         services = [service['name'] for service in db.foxx.services()]
         if 'apply' not in services or 'BrightID-Node' not in services:
-            print('foxx services are not running yet')
+            log.info('foxx services are not running yet')
             continue
         collections = [c['name'] for c in db.collections()]
         if 'apps' not in collections:
-            print('apps collection is not created yet')
+            log.info('apps collection is not created yet')
             continue
         apps = [app for app in db.collection('apps')]
         if len(apps) == 0:
-            print('apps collection is not loaded yet')
+            log.info('apps collection is not loaded yet')
             continue
         return
 
 
 if __name__ == '__main__':
+    metrics.serve(config.RECEIVER_METRICS_PORT)
+    start_trackers()
     while True:
         try:
-            print('waiting for db ...')
+            log.info('waiting for db ...')
             wait()
-            print('receiver started ...')
+            log.info('receiver started ...')
             main()
         except Exception as e:
-            print(f'Error: {e}')
-            print(f'Traceback: {traceback.format_exc()}')
+            log.error(f'Error: {e}')
+            log.error(f'Traceback: {traceback.format_exc()}')
             time.sleep(10)
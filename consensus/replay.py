@@ -0,0 +1,253 @@
+# Replays recorded or synthetic blocks through the receiver without a live
+# IDChain node or a running apply service and reports its throughput.
+#
+#   python3 replay.py generate blocks.jsonl --blocks 1000 --ops-per-tx 50
+#   python3 replay.py record blocks.jsonl --from-block 100 --to-block 200
+#   python3 replay.py replay blocks.jsonl --apply-latency 5
+import os
+import sys
+import json
+import time
+import random
+import base64
+import argparse
+import binascii
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TO_ADDRESS = '0xb1d1CDd5C4C541f95A73b5748392A6990cBe32b7'
+DEFAULT_MIX = 'v6:Connect=6,v6:Add Membership=2,v6:Add Group=1,v6:Social Recovery=1,v6:Sponsor=1,v5:Sponsor=1,v5:Link ContextId=1'
+LEVELS = ['just met', 'already known', 'recovery', 'reported']
+
+
+def random_id(size=33):
+    s = base64.b64encode(os.urandom(size)).decode('ascii')
+    return s.replace('+', '-').replace('/', '_').replace('=', '')
+
+
+def make_op(v, name, timestamp, payload_size):
+    op = {'name': name, 'timestamp': timestamp, 'v': v}
+    if name == 'Connect':
+        op.update({'id1': random_id(), 'id2': random_id(),
+                   'level': random.choice(LEVELS)})
+    elif name == 'Add Group':
+        op.update({'id': random_id(), 'group': random_id(),
+                   'inviteData2': random_id(64), 'url': 'https://example.com/g',
+                   'type': 'general'})
+    elif name == 'Add Membership':
+        op.update({'id': random_id(), 'group': random_id()})
+    elif name == 'Social Recovery':
+        op.update({'id': random_id(), 'signingKey': random_id(32)})
+    elif name == 'Sponsor' and v == 6:
+        op.update({'app': 'app', 'appUserId': random_id(20)})
+    elif name == 'Sponsor':
+        op.update({'app': 'app', 'contextId': random_id(20)})
+    elif name == 'Link ContextId':
+        op.update({'id': random_id(), 'context': 'context',
+                   'contextId': random_id(20)})
+    else:
+        op.update({'id': random_id()})
+    # the signature is padded to reach the requested operation size
+    size = len(json.dumps(op)) + len('"sig": ""')
+    op['sig'] = random_id(max(64, (payload_size - size) * 3 // 4))
+    return op
+
+
+def parse_mix(mix):
+    choices = []
+    weights = []
+    for item in mix.split(','):
+        key, weight = item.rsplit('=', 1)
+        v, name = key.split(':', 1)
+        choices.append((int(v.strip('v')), name))
+        weights.append(float(weight))
+    return choices, weights
+
+
+def generate(args):
+    choices, weights = parse_mix(args.mix)
+    timestamp = int(time.time())
+    with open(args.file, 'w') as f:
+        for number in range(1, args.blocks + 1):
+            transactions = []
+            for i in range(args.txs_per_block):
+                ops = []
+                for j in range(args.ops_per_tx):
+                    v, name = random.choices(choices, weights)[0]
+                    ops.append(make_op(v, name, timestamp * 1000,
+                                       args.payload_size))
+                data = json.dumps(ops).encode('utf-8')
+                transactions.append({
+                    'to': TO_ADDRESS,
+                    'input': '0x' + binascii.hexlify(data).decode('utf-8')
+                })
+            f.write(json.dumps({
+                'number': number,
+                'timestamp': timestamp,
+                'transactions': transactions
+            }) + '\n')
+            timestamp += 5
+    print(f'{args.blocks} blocks written to {args.file}')
+
+
+def record(args):
+    from web3 import Web3
+    from web3.middleware import geth_poa_middleware
+    w3 = Web3(Web3.WebsocketProvider(args.rpc))
+    w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    with open(args.file, 'w') as f:
+        for number in range(args.from_block, args.to_block + 1):
+            block = w3.eth.getBlock(number, True)
+            f.write(json.dumps({
+                'number': number,
+                'timestamp': block['timestamp'],
+                'transactions': [{
+                    'to': tx['to'],
+                    'input': tx['input']
+                } for tx in block['transactions']]
+            }) + '\n')
+    print(f'{args.to_block - args.from_block + 1} blocks written to {args.file}')
+
+
+class FakeEth:
+    # serves blocks from a file instead of an IDChain node
+
+    def __init__(self, blocks):
+        self.blocks = {b['number']: b for b in blocks}
+
+    def getBlock(self, number, full_transactions=False):
+        from web3.datastructures import AttributeDict
+        if number == 'latest':
+            number = max(self.blocks)
+        return AttributeDict(self.blocks[number])
+
+
+class FakeWeb3:
+
+    def __init__(self, blocks):
+        self.eth = FakeEth(blocks)
+
+
+def stub_handler(latency, conflict_rate):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_PUT(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if latency:
+                time.sleep(latency / 1000)
+            if random.random() < conflict_rate:
+                resp = {'success': True, 'state': 'failed',
+                        'result': {'arangoErrorNum': 1200}}
+            else:
+                resp = {'success': True, 'state': 'applied', 'result': {}}
+            body = json.dumps(resp).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def replay(args):
+    with open(args.file) as f:
+        blocks = [json.loads(line) for line in f if line.strip()]
+
+    if args.apply_url:
+        host, port = args.arango_host, args.arango_port
+        apply_url = args.apply_url
+    else:
+        server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), stub_handler(args.apply_latency, args.conflict_rate))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = '127.0.0.1', server.server_address[1]
+        apply_url = '/_db/_system/apply{v}/operations/{hash}'
+
+    # receiver reads its settings from the environment when imported
+    env = {
+        'BN_CONSENSUS_INFURA_URL': 'ws://127.0.0.1:1/',
+        'BN_CONSENSUS_MAX_DATA_SIZE': '100000',
+        'BN_CONSENSUS_GAS': '2000000',
+        'BN_CONSENSUS_GAS_PRICE': '10000000000',
+        'BN_CONSENSUS_TO_ADDRESS': TO_ADDRESS,
+        'BN_CONSENSUS_SNAPSHOTS_PERIOD': str(10**12),
+        'BN_ARANGO_PROTOCOL': 'http',
+        'BN_ARANGO_HOST': host,
+        'BN_ARANGO_PORT': str(port),
+        'BN_CONSENSUS_APPLY_URL': apply_url,
+        'BN_CONSENSUS_DUMP_URL': '/_api/replication/dump',
+        'BN_CONSENSUS_IDCHAIN_RPC_URL': 'http://127.0.0.1:1/',
+        'BN_CONSENSUS_LOG_LEVEL': args.log_level,
+        'BN_CONSENSUS_APPLIED_INDEX_PATH': os.path.join(
+            tempfile.mkdtemp(), 'applied_index'),
+    }
+    os.environ.update(env)
+    sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+    import receiver
+    receiver.w3 = FakeWeb3(blocks)
+
+    start = time.time()
+    for block in blocks:
+        receiver.process_block(receiver.get_block(block['number']))
+    duration = time.time() - start
+
+    ops = receiver.operations_total.value - receiver.conflict_retries_total.value
+    print(f'blocks: {len(blocks)}')
+    print(f'operations: {ops}')
+    print(f'conflict retries: {receiver.conflict_retries_total.value}')
+    print(f'duration: {duration:.2f} seconds')
+    print(f'blocks/sec: {len(blocks) / duration:.2f}')
+    print(f'ops/sec: {ops / duration:.2f}')
+    for name, value in receiver.apply_seconds.samples():
+        print(f'{name}: {value:.6f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay blocks through the consensus receiver')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('generate', help='write synthetic blocks')
+    p.add_argument('file')
+    p.add_argument('--blocks', type=int, default=100)
+    p.add_argument('--txs-per-block', type=int, default=1)
+    p.add_argument('--ops-per-tx', type=int, default=50)
+    p.add_argument('--payload-size', type=int, default=300,
+                   help='approximate size of each operation in bytes')
+    p.add_argument('--mix', default=DEFAULT_MIX,
+                   help='comma separated v<version>:<name>=<weight> items')
+    p.set_defaults(func=generate)
+
+    p = subparsers.add_parser('record', help='record blocks from a node')
+    p.add_argument('file')
+    p.add_argument('--rpc', default='wss://idchain.one/ws/')
+    p.add_argument('--from-block', type=int, required=True)
+    p.add_argument('--to-block', type=int, required=True)
+    p.set_defaults(func=record)
+
+    p = subparsers.add_parser('replay', help='replay blocks through receiver')
+    p.add_argument('file')
+    p.add_argument('--apply-latency', type=float, default=0,
+                   help='milliseconds the stub apply service waits')
+    p.add_argument('--conflict-rate', type=float, default=0,
+                   help='ratio of stub responses that report a conflict')
+    p.add_argument('--apply-url', default=None,
+                   help='use a real apply service instead of the stub')
+    p.add_argument('--arango-host', default='localhost')
+    p.add_argument('--arango-port', type=int, default=8529)
+    p.add_argument('--log-level', default='WARNING')
+    p.set_defaults(func=replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,57 +1,235 @@
 import socket
 import time
 import json
+import logging
 import binascii
-from arango import ArangoClient
 from web3 import Web3
 import config
+import database
+import metrics
+import payload
 
+log = logging.getLogger('sender')
 w3 = Web3(Web3.WebsocketProvider(config.INFURA_URL))
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
+db = database.db('_system')
+operations_coll = db.collection('operations')
+# the next nonce to use and the chain id are kept locally and the nonce is
+# reloaded from the chain after any error in sending a transaction or when
+# the mined transactions count does not move for NONCE_RESYNC_TIMEOUT
+nonce = None
+chain_id = None
+mined = None
+mined_changed = 0
+
+queue_depth = metrics.Gauge(
+    'sender_queue_depth', 'Number of operations waiting to be sent')
+transactions_total = metrics.Counter(
+    'sender_transactions_total', 'Number of sent transactions')
+operations_total = metrics.Counter(
+    'sender_operations_total', 'Number of sent operations')
+transaction_bytes = metrics.Summary(
+    'sender_transaction_bytes', 'Size of data of sent transactions')
+send_seconds = metrics.Summary(
+    'sender_send_seconds', 'Time to sign and send a transaction')
+pending_transactions_gauge = metrics.Gauge(
+    'sender_pending_transactions', 'Number of sent transactions not mined yet')
+init_to_sent_seconds = metrics.Summary(
+    'sender_init_to_sent_seconds',
+    'Time from creating an operation to sending it')
+arango_seconds = metrics.Summary(
+    'sender_arango_request_seconds', 'Time of a request to ArangoDB')
+database.hooks.append(
+    lambda method, url, status, seconds: arango_seconds.observe(seconds))
+# compressed to json size ratio of the last transaction that is used to
+# estimate how many operations fit in a compressed transaction
+compression_ratio = 1.0
+
+
+COUNT_QUEUE = '''
+    RETURN LENGTH(
+        FOR o IN operations
+            FILTER o.state == "init"
+            RETURN 1
+    )
+'''
+PENDING_OPERATIONS = '''
+    FOR o IN operations
+        FILTER o.state == "init"
+        SORT o.timestamp
+        LIMIT @limit
+        RETURN o
+'''
+
+
+def count_queue():
+    return db.aql.execute(COUNT_QUEUE).next()
 
 
 def sendTransaction(data):
-    nonce = w3.eth.getTransactionCount(config.ADDRESS, 'pending')
+    global nonce, chain_id
+    if chain_id is None:
+        chain_id = w3.eth.chainId
+    if nonce is None:
+        nonce = w3.eth.getTransactionCount(config.ADDRESS, 'pending')
     tx = {
         'to': config.TO_ADDRESS,
         'value': 0,
         'gas': config.GAS,
         'gasPrice': config.GAS_PRICE,
         'nonce': nonce,
-        'chainId': w3.eth.chainId,
+        'chainId': chain_id,
         'data': data
     }
     signed = w3.eth.account.sign_transaction(tx, config.PRIVATE_KEY)
-    tx = w3.eth.sendRawTransaction(signed.rawTransaction).hex()
+    try:
+        tx = w3.eth.sendRawTransaction(signed.rawTransaction).hex()
+    except Exception:
+        nonce = None
+        raise
+    nonce += 1
     return tx
 
 
-def main():
+def pending_transactions():
+    global nonce, mined, mined_changed
+    if nonce is None:
+        return 0
+    latest = w3.eth.getTransactionCount(config.ADDRESS, 'latest')
+    if latest != mined:
+        mined = latest
+        mined_changed = time.time()
+    elif (nonce > latest
+          and time.time() - mined_changed > config.NONCE_RESYNC_TIMEOUT):
+        # a sent transaction may be dropped from the txpool, so the later
+        # ones can never be mined until its nonce is used again
+        nonce = w3.eth.getTransactionCount(config.ADDRESS, 'pending')
+        mined_changed = time.time()
+        log.warning(f'no transaction mined in {config.NONCE_RESYNC_TIMEOUT} '
+                    f'seconds, nonce is reloaded as {nonce}')
+    return max(nonce - latest, 0)
+
+
+def pending_operations():
+    return db.aql.execute(PENDING_OPERATIONS,
+                          bind_vars={'limit': config.PACKING_CANDIDATES})
+
+
+def references(op):
+    # users, groups and apps an operation reads or changes
+    return {op[k] for k in config.REFERENCE_FIELDS
+            if isinstance(op.get(k), str)}
+
+
+def pack(candidates, limit):
+    # fills the transaction up to limit by first-fit and tracks the size
+    # of json.dumps(operations) without serializing the list again
     operations = []
     hashes = []
     ignore = ['_id', '_rev', 'state', '_key', 'hash']
-    for op in db.collection('operations').find({'state': 'init'}):
+    size = len('[]')
+    skipped = set()
+    for op in candidates:
         d = {k: op[k] for k in op if k not in ignore}
-        if len(json.dumps(operations)) + len(json.dumps(d)) > config.MAX_DATA_SIZE:
-            break
+        # operations that reference a user, group or app of a skipped
+        # operation are skipped too to not be applied before it
+        refs = references(d)
+        if refs & skipped:
+            skipped |= refs
+            continue
+        op_size = len(json.dumps(d)) + (len(', ') if operations else 0)
+        if size + op_size > limit:
+            skipped |= refs
+            continue
+        size += op_size
         hashes.append(op['hash'])
         operations.append(d)
-        print(d)
+        log.debug(d)
+    return operations, hashes
+
+
+def encode(operations, hashes):
+    global compression_ratio
+    if not config.COMPRESS_PAYLOAD:
+        return json.dumps(operations).encode('utf-8'), operations, hashes
+    while True:
+        data = payload.encode(operations)
+        if len(data) <= config.MAX_DATA_SIZE:
+            break
+        if len(operations) == 1:
+            # the operation does not fit in a transaction even alone
+            return None, operations, hashes
+        # the estimated ratio was too optimistic so drop the last operations
+        n = max(1, len(operations) * config.MAX_DATA_SIZE // len(data))
+        operations, hashes = operations[:n], hashes[:n]
+    compression_ratio = len(data) / len(json.dumps(operations))
+    return data, operations, hashes
+
+
+def send_operations():
+    limit = config.MAX_DATA_SIZE
+    if config.COMPRESS_PAYLOAD:
+        ratio = min(max(compression_ratio, 0.25), 1)
+        limit = int(config.MAX_DATA_SIZE / ratio * 0.9)
+    operations, hashes = pack(pending_operations(), limit)
 
     if not operations:
-        return
+        return False
 
-    data = json.dumps(operations).encode('utf-8')
+    data, operations, hashes = encode(operations, hashes)
+    if data is None:
+        # it would fail on chain and stay at the head of the queue
+        message = f'operation is larger than {config.MAX_DATA_SIZE} bytes'
+        log.error(f'{hashes[0]}: {message}')
+        operations_coll.update({
+            '_key': hashes[0],
+            'state': 'failed',
+            'result': {'message': message}
+        })
+        return True
+    transaction_bytes.observe(len(data))
     data = '0x' + binascii.hexlify(data).decode('utf-8')
-    transaction_hash = sendTransaction(data)
-    for i, op in enumerate(operations):
-        db.collection('operations').update(
-            {
-                '_key': hashes[i],
-                'state': 'sent',
-                'transactionHash': transaction_hash
-            }, merge=True
-        )
+    with send_seconds.time():
+        transaction_hash = sendTransaction(data)
+    transactions_total.inc()
+    operations_total.inc(len(operations))
+    now = time.time()
+    for op in operations:
+        # operations' timestamps are in milliseconds
+        if isinstance(op.get('timestamp'), (int, float)):
+            init_to_sent_seconds.observe(now - op['timestamp'] / 1000)
+    db.aql.execute('''
+        FOR h IN @hashes
+            UPDATE { _key: h }
+            WITH { state: 'sent', transactionHash: @transaction_hash }
+            IN operations
+    ''', bind_vars={'hashes': hashes, 'transaction_hash': transaction_hash})
+    return True
+
+
+def main():
+    queue_depth.set(count_queue())
+    # keep sending while the queue is not empty and there are not
+    # too many transactions waiting to be mined
+    while True:
+        pending = pending_transactions()
+        pending_transactions_gauge.set(pending)
+        if pending >= config.MAX_PENDING_TRANSACTIONS:
+            break
+        if not send_operations():
+            break
+
+
+def wait_for_operations():
+    # returns as soon as the operations collection changes; the polling
+    # interval doubles while it does not change
+    revision = operations_coll.revision()
+    deadline = time.time() + config.SENDER_IDLE_TIMEOUT
+    interval = config.SENDER_POLL_INTERVAL
+    while time.time() < deadline:
+        time.sleep(min(interval, max(deadline - time.time(), 0)))
+        if operations_coll.revision() != revision:
+            return
+        interval = min(interval * 2, config.SENDER_MAX_POLL_INTERVAL)
 
 
 def wait():
@@ -62,30 +240,33 @@ def wait():
             (config.BN_ARANGO_HOST, config.BN_ARANGO_PORT))
         sock.close()
         if result != 0:
-            print('db is not running yet')
+            log.info('db is not running yet')
             continue
         # wait for ws to start upgrading foxx services and running setup script
         time.sleep(10)
         services = [service['name'] for service in db.foxx.services()]
         if 'apply' not in services or 'BrightID-Node' not in services:
-            print('foxx services are not running yet')
+            log.info('foxx services are not running yet')
             continue
         collections = [c['name'] for c in db.collections()]
         if 'operations' not in collections:
-            print('operations collection is not created yet')
+            log.info('operations collection is not created yet')
             continue
         return
 
 
 if __name__ == '__main__':
-    print('waiting for db ...')
+    metrics.serve(config.SENDER_METRICS_PORT)
+    log.info('waiting for db ...')
     wait()
-    print('sender started ...')
+    database.ensure_indexes('_system', config.INDEXES)
+    log.info('sender started ...')
     while True:
         try:
             main()
-            time.sleep(1)
+            wait_for_operations()
         except Exception as e:
-            print(f'Error: {e}')
+            log.error(f'Error: {e}')
+            nonce = None
             time.sleep(10)
-            print('sender started ...')
+            log.info('sender started ...')
@@ -0,0 +1,259 @@
+import os
+import time
+import json
+import logging
+import shutil
+import hashlib
+import threading
+import config
+import database
+import graph
+import metrics
+
+log = logging.getLogger('snapshots')
+
+# replication marker types that are used in computing deltas
+DOCUMENT_MARKER = 2300
+REMOVE_MARKER = 2302
+# creating, dropping, renaming or truncating a collection can not be
+# expressed as a delta and forces a full dump
+COLLECTION_MARKERS = (2000, 2001, 2002, 2004)
+
+dumper = None
+last_dump = None
+
+dump_seconds = metrics.Summary(
+    'receiver_snapshot_dump_seconds', 'Time to dump a snapshot')
+delta_fallbacks = metrics.Counter(
+    'receiver_snapshot_delta_fallbacks_total',
+    'Number of snapshots dumped in full because a delta was not possible')
+fence_seconds = metrics.Summary(
+    'receiver_snapshot_fence_seconds',
+    'Time block processing is paused to start a snapshot')
+
+
+def load_collections():
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    with open(os.path.join(dir_path, 'collections.json')) as f:
+        return list(json.load(f).keys())
+
+
+def create_batch():
+    # the server id registers the dumper as a replication client, so the
+    # database keeps the write-ahead log from the tick of a live batch
+    r = database.request('post', config.BATCH_URL,
+                         params={'serverId': config.DUMP_SERVER_ID},
+                         json={'ttl': config.DUMP_BATCH_TTL})
+    r.raise_for_status()
+    return r.json()
+
+
+def extend_batch(batch_id, ttl=config.DUMP_BATCH_TTL):
+    r = database.request('put', f'{config.BATCH_URL}/{batch_id}',
+                         params={'serverId': config.DUMP_SERVER_ID},
+                         json={'ttl': ttl})
+    r.raise_for_status()
+
+
+def delete_batch(batch_id):
+    try:
+        database.request('delete', f'{config.BATCH_URL}/{batch_id}')
+    except Exception as e:
+        log.error(f'Error in deleting dump batch {batch_id}: {e}')
+
+
+def dump_collection(name, batch_id, fpath):
+    with open(fpath, 'wb') as f:
+        while True:
+            r = database.request('get', config.DUMP_URL, params={
+                'collection': name,
+                'batchId': batch_id,
+                'chunkSize': config.DUMP_CHUNK_SIZE
+            }, stream=True)
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+            extend_batch(batch_id)
+            if r.headers.get('x-arango-replication-checkmore') != 'true':
+                break
+
+
+def dump(batch, dir_name):
+    # write the same layout arangodump does so arangorestore
+    # in the scorer can restore it without any change
+    shutil.rmtree(dir_name, ignore_errors=True)
+    os.makedirs(dir_name)
+    r = database.request('get', config.INVENTORY_URL, params={
+        'batchId': batch['id'],
+        'includeSystem': 'false'
+    })
+    r.raise_for_status()
+    collections = load_collections()
+    data_files = {}
+    for c in r.json()['collections']:
+        name = c['parameters']['name']
+        if name not in collections:
+            continue
+        fpath = os.path.join(dir_name, f'{name}.structure.json')
+        with open(fpath, 'w') as f:
+            json.dump({'indexes': c['indexes'],
+                       'parameters': c['parameters']}, f)
+        md5 = hashlib.md5(name.encode('utf-8')).hexdigest()
+        fpath = os.path.join(dir_name, f'{name}_{md5}.data.json')
+        dump_collection(name, batch['id'], fpath)
+        data_files[name] = fpath
+    with open(os.path.join(dir_name, 'dump.json'), 'w') as f:
+        json.dump({
+            'database': '_system',
+            'lastTickAtDumpStart': batch.get('lastTick')
+        }, f)
+    with open(os.path.join(dir_name, 'ENCRYPTION'), 'w') as f:
+        f.write('none')
+    return data_files
+
+
+def dump_delta(batch, base, dir_name):
+    shutil.rmtree(dir_name, ignore_errors=True)
+    os.makedirs(dir_name)
+    r = database.request('get', config.INVENTORY_URL, params={
+        'batchId': batch['id'],
+        'includeSystem': 'false'
+    })
+    r.raise_for_status()
+    collections = load_collections()
+    names = {}
+    for c in r.json()['collections']:
+        p = c['parameters']
+        if p['name'] in collections:
+            names[str(p['id'])] = p['name']
+            names[p.get('globallyUniqueId')] = p['name']
+
+    # only the last state of each changed document is kept
+    changes = {name: {} for name in collections}
+    tick = base['tick']
+    while True:
+        r = database.request('get', config.WAL_TAIL_URL, params={
+            'from': tick,
+            'to': batch['lastTick'],
+            'global': 'false',
+            'chunkSize': config.DUMP_CHUNK_SIZE,
+            'serverId': config.DUMP_SERVER_ID,
+            'syncerId': config.DUMP_SERVER_ID
+        }, stream=True)
+        r.raise_for_status()
+        if r.headers.get('x-arango-replication-frompresent') == 'false':
+            log.warning(f'write-ahead log is not available from tick {tick}')
+            return None
+        for line in r.iter_lines():
+            if not line:
+                continue
+            marker = json.loads(line)
+            name = names.get(marker.get('cuid')) or names.get(
+                str(marker.get('cid')))
+            if not name:
+                continue
+            if marker['type'] in COLLECTION_MARKERS:
+                log.warning(
+                    f'{name} collection is changed since the last snapshot')
+                return None
+            if marker['type'] == DOCUMENT_MARKER:
+                changes[name][marker['data']['_key']] = marker['data']
+            elif marker['type'] == REMOVE_MARKER:
+                changes[name][marker['data']['_key']] = None
+        if r.headers.get('x-arango-replication-checkmore') != 'true':
+            break
+        tick = r.headers.get('x-arango-replication-lastincluded', '0')
+        if tick == '0':
+            tick = r.headers['x-arango-replication-lastscanned']
+
+    for name, docs in changes.items():
+        fpath = os.path.join(dir_name, f'{name}.delta.json')
+        with open(fpath, 'w') as f:
+            for key, doc in docs.items():
+                if doc is None:
+                    change = {'type': 'remove', 'key': key}
+                else:
+                    change = {'type': 'upsert', 'data': doc}
+                f.write(json.dumps(change) + '\n')
+    with open(os.path.join(dir_name, 'delta.json'), 'w') as f:
+        json.dump({'base': base['block'], 'lastTick': batch['lastTick']}, f)
+    return {name: os.path.join(dir_name, f'{name}.delta.json')
+            for name in collections}
+
+
+def save_graph(dir_name, data_files=None, delta_files=None):
+    # graph.bin is an optional sidecar so failing to build it
+    # should not fail the snapshot
+    try:
+        if data_files is not None:
+            graph.load_dump(data_files)
+        else:
+            graph.apply_delta(delta_files)
+        graph.save(os.path.join(dir_name, 'graph.bin'))
+    except Exception as e:
+        log.error(f'Error in saving graph of {dir_name}: {e}')
+        graph.state = None
+
+
+def dump_worker(block, batch, base, previous):
+    global last_dump
+    dir_name = config.SNAPSHOTS_PATH.format(block)
+    start = time.time()
+    kept = False
+    try:
+        delta_files = None
+        if base:
+            delta_files = dump_delta(batch, base, dir_name)
+            if not delta_files:
+                delta_fallbacks.inc()
+                log.warning(f'snapshot of block {block} is dumped in full '
+                            f'instead of a delta of block {base["block"]}')
+        if delta_files:
+            save_graph(dir_name, delta_files=delta_files)
+        else:
+            data_files = dump(batch, dir_name)
+            last_dump['deltas'] = 0
+            save_graph(dir_name, data_files=data_files)
+        # the scorer only picks up snapshots that are renamed to _fnl
+        shutil.move(dir_name, f'{dir_name}_fnl')
+        # the batch keeps the write-ahead log from its tick until the
+        # next snapshot is dumped as a delta of this one
+        extend_batch(batch['id'], config.BASE_BATCH_TTL)
+        kept = True
+        dump_seconds.observe(time.time() - start)
+        log.info(f'snapshot of block {block} saved')
+    except Exception as e:
+        log.error(f'Error in dumping snapshot of block {block}: {e}')
+        shutil.rmtree(dir_name, ignore_errors=True)
+        # the next snapshot can not be a delta of a missing one
+        last_dump = None
+    finally:
+        if not kept:
+            delete_batch(batch['id'])
+        if previous:
+            delete_batch(previous['batch'])
+
+
+def save_snapshot(block):
+    global dumper, last_dump
+    start = time.time()
+    if dumper and dumper.is_alive():
+        log.info('waiting for the previous snapshot to be dumped')
+        dumper.join()
+    # the batch pins a consistent view of the database at this block and
+    # is dumped in the background while the next blocks are processed
+    batch = create_batch()
+    previous = last_dump
+    base = previous
+    if base and base['deltas'] + 1 >= config.SNAPSHOTS_FULL_PERIODS:
+        base = None
+    last_dump = {
+        'block': block,
+        'tick': batch['lastTick'],
+        'batch': batch['id'],
+        'deltas': base['deltas'] + 1 if base else 0
+    }
+    dumper = threading.Thread(
+        target=dump_worker, args=(block, batch, base, previous), daemon=True)
+    dumper.start()
+    fence_seconds.observe(time.time() - start)
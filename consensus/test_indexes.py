@@ -0,0 +1,26 @@
+import testenv  # noqa: F401
+import unittest
+import config
+import dbtest
+import receiver
+import sender
+
+
+class TestIndexes(dbtest.IndexTests, unittest.TestCase):
+    collections = {'operations': False}
+    indexes = config.INDEXES
+    queries = [
+        (sender.COUNT_QUEUE, {}),
+        (sender.PENDING_OPERATIONS, {'limit': 10}),
+        (receiver.REMOVE_OLD_OPERATIONS, {'border': 1, 'limit': 10}),
+    ]
+
+    def test_pending_operations_are_not_sorted(self):
+        # the index on state and timestamp returns them in order
+        nodes = dbtest.explain(
+            self.name, sender.PENDING_OPERATIONS, {'limit': 10})
+        self.assertNotIn('SortNode', [n['type'] for n in nodes])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import zlib
+import json
+import payload
+
+OPERATIONS = [{
+    'name': 'Connect',
+    'id1': 'u1',
+    'id2': 'u2',
+    'level': 'just met',
+    'timestamp': 1612900000000,
+    'sig1': 'c2lnMQ',
+    'v': 6
+}, {
+    'name': 'Add Group',
+    'group': 'g1',
+    'id1': 'u1',
+    'inviteData2': 'ZGF0YQ',
+    'url': 'https://example.com/ö',
+    'type': 'general',
+    'timestamp': 1612900000001,
+    'sig1': 'c2lnMg',
+    'v': 6
+}]
+
+
+class TestPayload(unittest.TestCase):
+
+    def test_round_trip(self):
+        for operations in (OPERATIONS, [], [{'v': 6}] * 1000):
+            data = payload.encode(operations)
+            self.assertTrue(payload.is_encoded(data))
+            self.assertEqual(payload.decode(data), operations)
+
+    def test_smaller_than_json(self):
+        message = json.dumps(OPERATIONS).encode('utf-8')
+        self.assertLess(len(payload.encode(OPERATIONS)), len(message))
+
+    def test_json_is_not_encoded(self):
+        for data in (b'[{"v": 6}]', b'{}', b'', b'\xb1'):
+            self.assertFalse(payload.is_encoded(data))
+            with self.assertRaises(ValueError):
+                payload.decode(data)
+
+    def test_invalid(self):
+        data = payload.encode(OPERATIONS)
+        with self.assertRaises(ValueError):
+            payload.decode(payload.MAGIC)
+        with self.assertRaises(ValueError):
+            payload.decode(payload.MAGIC + bytes([255]) + data[3:])
+        with self.assertRaises(ValueError):
+            payload.decode(data[:3] + b'\xff' * 10)
+
+    def test_too_large(self):
+        message = b'[' + b'0,' * payload.MAX_DECODED_SIZE + b'0]'
+        compressor = zlib.compressobj(
+            level=9, wbits=-15,
+            zdict=payload.DICTIONARIES[payload.VERSION])
+        data = payload.MAGIC + bytes([payload.VERSION]) + \
+            compressor.compress(message) + compressor.flush()
+        with self.assertRaises(ValueError):
+            payload.decode(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
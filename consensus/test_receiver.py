@@ -0,0 +1,42 @@
+import testenv  # noqa: F401
+import json
+import unittest
+import payload
+import receiver
+
+OPERATIONS = [{
+    'name': 'Connect',
+    'id1': 'u1',
+    'id2': 'u2',
+    'level': 'just met',
+    'timestamp': 1612900000000,
+    'v': 6
+}]
+
+
+class TestParse(unittest.TestCase):
+
+    def test_legacy_json(self):
+        data = json.dumps(OPERATIONS).encode('utf-8').hex()
+        self.assertEqual(receiver.parse('0x' + data), OPERATIONS)
+        self.assertEqual(receiver.parse(data), OPERATIONS)
+
+    def test_legacy_json_with_trailing_zeros(self):
+        message = json.dumps(OPERATIONS).encode('utf-8')
+        for data in ((message + b' ').hex(), (message + b'\x00' * 3).hex()):
+            self.assertTrue(data.endswith('0'))
+            self.assertEqual(receiver.parse('0x' + data), OPERATIONS)
+
+    def test_encoded(self):
+        for operations in (OPERATIONS, OPERATIONS * 100):
+            data = payload.encode(operations).hex()
+            self.assertEqual(receiver.parse('0x' + data), operations)
+
+    def test_invalid(self):
+        for data in ('0x', '0x5b', '0xzz', '0x' + payload.MAGIC.hex()):
+            with self.assertRaises(ValueError):
+                receiver.parse(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
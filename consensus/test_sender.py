@@ -0,0 +1,119 @@
+import testenv  # noqa: F401
+import json
+import random
+import string
+import unittest
+import config
+import sender
+
+
+def operation(name, padding=0, **fields):
+    op = {'name': name, 'timestamp': 1, 'v': 6, **fields}
+    if padding:
+        op['data'] = 'x' * padding
+    op['hash'] = f'{name}-{json.dumps(fields, sort_keys=True)}'
+    return op
+
+
+def packed(candidates, limit):
+    operations, hashes = sender.pack(candidates, limit)
+    return hashes
+
+
+class TestPack(unittest.TestCase):
+
+    def test_all_fit_in_order(self):
+        ops = [
+            operation('Add Group', id='u1', group='g1'),
+            operation('Add Membership', id='u2', group='g1'),
+            operation('Connect', id1='u2', id2='u3'),
+        ]
+        self.assertEqual(packed(ops, 10000), [op['hash'] for op in ops])
+
+    def test_size_limit(self):
+        ops = [operation('Connect', id1=f'u{i}', id2=f'v{i}')
+               for i in range(20)]
+        operations, _ = sender.pack(ops, 500)
+        self.assertLessEqual(len(json.dumps(operations)), 500)
+        # the tracked size is the size of json.dumps(operations)
+        operations, _ = sender.pack(ops, 10000)
+        size = len(json.dumps(operations))
+        self.assertEqual(len(sender.pack(ops, size)[0]), len(ops))
+        self.assertEqual(len(sender.pack(ops, size - 1)[0]), len(ops) - 1)
+
+    def test_first_fit(self):
+        large = operation('Connect', 1000, id1='u1', id2='u2')
+        small = operation('Connect', id1='u3', id2='u4')
+        self.assertEqual(packed([large, small], 500), [small['hash']])
+
+    def test_operations_of_a_skipped_signer(self):
+        large = operation('Connect', 1000, id1='u1', id2='u2')
+        later = operation('Add Signing Key', id='u1', signingKey='k')
+        self.assertEqual(packed([large, later], 500), [])
+
+    def test_membership_of_a_skipped_group(self):
+        group = operation('Add Group', 1000, id='u1', group='g1')
+        membership = operation('Add Membership', id='u2', group='g1')
+        other = operation('Add Membership', id='u3', group='g2')
+        self.assertEqual(packed([group, membership, other], 500),
+                         [other['hash']])
+
+    def test_connection_to_a_skipped_user(self):
+        large = operation('Add Signing Key', 1000, id='u1', signingKey='k')
+        connect = operation('Connect', id1='u2', id2='u1')
+        self.assertEqual(packed([large, connect], 500), [])
+
+    def test_dependencies_of_dependent_operations(self):
+        # u2's connection waits for u1, so u2's later operations and the
+        # operations that depend on them wait too
+        large = operation('Add Signing Key', 1000, id='u1', signingKey='k')
+        connect = operation('Connect', id1='u2', id2='u1')
+        group = operation('Add Group', id='u2', group='g1')
+        membership = operation('Add Membership', id='u3', group='g1')
+        self.assertEqual(
+            packed([large, connect, group, membership], 500), [])
+
+    def test_ignored_fields(self):
+        op = operation('Connect', id1='u1', id2='u2')
+        op.update({'_id': 'operations/h', '_key': 'h', '_rev': 'r',
+                   'state': 'init'})
+        operations, _ = sender.pack([op], 10000)
+        self.assertEqual(set(operations[0]),
+                         {'name', 'timestamp', 'v', 'id1', 'id2'})
+
+
+class TestEncode(unittest.TestCase):
+
+    def setUp(self):
+        self.compress = config.COMPRESS_PAYLOAD
+        self.max_data_size = config.MAX_DATA_SIZE
+        config.COMPRESS_PAYLOAD = True
+        config.MAX_DATA_SIZE = 500
+
+    def tearDown(self):
+        config.COMPRESS_PAYLOAD = self.compress
+        config.MAX_DATA_SIZE = self.max_data_size
+
+    def encoded(self, ops):
+        operations, hashes = sender.pack(ops, 100000)
+        return sender.encode(operations, hashes)
+
+    def test_drop_last_operations(self):
+        ops = [operation('Connect', id1=f'u{i}', id2=f'v{i}')
+               for i in range(100)]
+        data, operations, hashes = self.encoded(ops)
+        self.assertLessEqual(len(data), config.MAX_DATA_SIZE)
+        self.assertLess(len(operations), len(ops))
+        self.assertEqual(hashes, [op['hash'] for op in ops[:len(hashes)]])
+
+    def test_operation_too_large(self):
+        # random data is not compressed enough to fit
+        op = operation('Connect', id1='u1', id2='u2')
+        op['data'] = ''.join(random.choices(string.ascii_letters, k=2000))
+        data, operations, hashes = self.encoded([op])
+        self.assertIsNone(data)
+        self.assertEqual(hashes, [op['hash']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,16 @@
+# default config of the tests; imported by the test modules before config
+import os
+os.environ.setdefault('BN_CONSENSUS_INFURA_URL', 'wss://idchain.one/ws/')
+os.environ.setdefault('BN_CONSENSUS_MAX_DATA_SIZE', '100000')
+os.environ.setdefault('BN_CONSENSUS_GAS', '2000000')
+os.environ.setdefault('BN_CONSENSUS_GAS_PRICE', '10000000000')
+os.environ.setdefault('BN_CONSENSUS_TO_ADDRESS',
+                      '0xb1d1CDd5C4C541f95A73b5748392A6990cBe32b7')
+os.environ.setdefault('BN_CONSENSUS_SNAPSHOTS_PERIOD', '240')
+os.environ.setdefault('BN_ARANGO_PROTOCOL', 'http')
+os.environ.setdefault('BN_ARANGO_HOST', 'localhost')
+os.environ.setdefault('BN_ARANGO_PORT', '8529')
+os.environ.setdefault('BN_CONSENSUS_APPLY_URL',
+                      '/_db/_system/apply{v}/operations/{hash}')
+os.environ.setdefault('BN_CONSENSUS_DUMP_URL', '/_api/replication/dump')
+os.environ.setdefault('BN_CONSENSUS_IDCHAIN_RPC_URL', 'https://idchain.one/rpc/')
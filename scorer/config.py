@@ -14,4 +14,32 @@ BN_ARANGO_PROTOCOL = os.environ['BN_ARANGO_PROTOCOL']
 BN_ARANGO_HOST = os.environ['BN_ARANGO_HOST']
 BN_ARANGO_PORT = int(os.environ['BN_ARANGO_PORT'])
 ARANGO_SERVER = f'{BN_ARANGO_PROTOCOL}://{BN_ARANGO_HOST}:{BN_ARANGO_PORT}'
+
+# seconds to wait for a response of ArangoDB; there is no read timeout by
+# default because the verifiers run long queries over the whole graph
+ARANGO_READ_TIMEOUT = float(os.environ['BN_ARANGO_READ_TIMEOUT']) \
+    if os.environ.get('BN_ARANGO_READ_TIMEOUT') else None
+# persistent indexes as (collection, fields) that the queries of the
+# verifiers rely on; the ones of the snapshot database are created after
+# each restore
+INDEXES = [
+    ('verifications', ['name', 'block']),
+    ('verifications', ['block', 'user']),
+    ('verifications', ['user', 'block']),
+    ('verifications', ['expired']),
+]
+SNAPSHOT_INDEXES = [
+    ('connections', ['_from', 'level', 'timestamp']),
+    ('connections', ['_from', '_to']),
+    ('connections', ['level']),
+    ('groups', ['seed']),
+    ('users', ['dfeAdmin']),
+]
 SNAPSHOTS_PERIOD = int(os.environ['BN_CONSENSUS_SNAPSHOTS_PERIOD'])
+# the databases that snapshots are loaded in by turns and the number of
+# threads arangorestore uses to load them
+SNAPSHOT_DBS = ['snapshot', 'snapshot2']
+RESTORE_THREADS = int(os.environ.get('BN_SCORER_RESTORE_THREADS', 4))
+# the verification hashes of each verifier are put in 64 ** prefix buckets
+# that are the leaves of the merkle trees used to compare nodes
+MERKLE_PREFIX_LENGTH = int(os.environ.get('BN_SCORER_MERKLE_PREFIX_LENGTH', 2))
@@ -0,0 +1,19 @@
+import os
+import config
+import graphfile
+
+# reader of the graph.bin sidecar that the consensus receiver writes next
+# to each snapshot; see common/graphfile.py for the layout
+LEVELS = graphfile.LEVELS
+
+
+def load(block):
+    fpath = os.path.join(
+        config.SNAPSHOTS_PATH, f'dump_{block}_fnl', 'graph.bin')
+    if not os.path.exists(fpath):
+        return None
+    try:
+        return graphfile.Graph(fpath)
+    except Exception as e:
+        print(f'Error in loading {fpath}: {e}')
+        return None
@@ -0,0 +1,257 @@
+# Merkle trees over the verification hashes of each verifier. Users are put
+# in buckets by the first characters of their keys and every leaf is the sum
+# of one bucket's hashes, so two nodes can find the users they disagree on by
+# walking down only the branches of their trees that differ.
+#
+#   python3 merkle.py compare http://node1:8529 http://node2:8529
+#   python3 merkle.py prove http://node1:8529 BrightID <user>
+import base64
+import string
+import argparse
+from hashlib import sha256
+
+# user keys are base64url strings; other characters go to the first bucket
+ALPHABET = string.ascii_uppercase + string.ascii_lowercase + string.digits + '-_'
+VARIABLE = 'VERIFICATIONS_MERKLE'
+MODULUS = 2 ** 256
+# the users and hashes of a verifier in one bucket of a block
+BUCKET = '''
+    FOR v IN verifications
+        FILTER v.name == @name
+            AND v.block <= @block
+            AND (v.expired == null OR v.expired > @block)
+            AND SUBSTRING(v.user, 0, @length) == @prefix
+            AND v.hash != null
+        RETURN [v.user, v.hash]
+'''
+
+
+def encode(digest):
+    h = base64.b64encode(digest).decode('ascii')
+    return h.replace('/', '_').replace('+', '-').replace('=', '')
+
+
+def decode(h):
+    h = h.replace('_', '/').replace('-', '+')
+    return base64.b64decode(h + '=' * (-len(h) % 4))
+
+
+def bucket(user, prefix):
+    index = 0
+    for c in user[:prefix].ljust(prefix, ALPHABET[0]):
+        index = index * len(ALPHABET) + max(ALPHABET.find(c), 0)
+    return index
+
+
+def bucket_prefix(index, prefix):
+    chars = []
+    for i in range(prefix):
+        index, r = divmod(index, len(ALPHABET))
+        chars.insert(0, ALPHABET[r])
+    return ''.join(chars)
+
+
+def value(h):
+    return int.from_bytes(sha256(h.encode('ascii')).digest(), 'big')
+
+
+def to_bytes(n):
+    return n.to_bytes(32, 'big')
+
+
+def leaf(hashes):
+    return to_bytes(sum(map(value, hashes)) % MODULUS)
+
+
+def parent(left, right):
+    return sha256(decode(left) + decode(right)).digest()
+
+
+class Accumulator:
+    # hashes are added as they are written in any order; the sums of
+    # their sha256 values do not depend on the order or need sorting
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.total = 0
+        self.buckets = [0] * (len(ALPHABET) ** prefix)
+
+    def add(self, user, h):
+        n = value(h)
+        self.total = (self.total + n) % MODULUS
+        i = bucket(user, self.prefix)
+        self.buckets[i] = (self.buckets[i] + n) % MODULUS
+
+    def digest(self):
+        return encode(to_bytes(self.total))
+
+    def tree(self):
+        # the returned levels go from the root to the leaves and hold
+        # the base64url encoded node hashes
+        level = [encode(to_bytes(n)) for n in self.buckets]
+        levels = [level]
+        while len(level) > 1:
+            level = [encode(parent(level[i], level[i + 1]))
+                     for i in range(0, len(level), 2)]
+            levels.insert(0, level)
+        return levels
+
+
+def verify_proof(node, index, path, root):
+    for sibling in path:
+        if index % 2 == 0:
+            node = encode(parent(node, sibling))
+        else:
+            node = encode(parent(sibling, node))
+        index //= 2
+    return node == root
+
+
+class Node:
+    # reads the parts of a node's trees that are needed without
+    # downloading whole trees
+
+    def __init__(self, url):
+        from arango import ArangoClient
+        self.url = url
+        self.db = ArangoClient(hosts=url).db('_system')
+
+    def info(self):
+        cursor = self.db.aql.execute('''
+            LET m = DOCUMENT('variables', @key)
+            RETURN {
+                prefix: m.prefix,
+                trees: (
+                    FOR block IN ATTRIBUTES(m.trees)
+                        RETURN { block, verifiers: ATTRIBUTES(m.trees[block]) }
+                )
+            }
+        ''', bind_vars={'key': VARIABLE})
+        info = cursor.next()
+        if info['prefix'] is None:
+            raise Exception(f'{self.url} has no {VARIABLE}')
+        return info
+
+    def nodes(self, block, name, depth, indexes):
+        cursor = self.db.aql.execute('''
+            LET level = DOCUMENT('variables', @key).trees[@block][@name][@depth]
+            FOR i IN @indexes
+                RETURN level[i]
+        ''', bind_vars={'key': VARIABLE, 'block': block, 'name': name,
+                        'depth': depth, 'indexes': indexes})
+        return list(cursor)
+
+    def bucket(self, block, name, prefix, index):
+        cursor = self.db.aql.execute(BUCKET, bind_vars={'name': name, 'block': int(block), 'length': prefix,
+                        'prefix': bucket_prefix(index, prefix)})
+        return {user: h for user, h in cursor}
+
+
+def divergent_buckets(a, b, block, name, depth):
+    indexes = [0]
+    for level in range(depth + 1):
+        nodes_a = a.nodes(block, name, level, indexes)
+        nodes_b = b.nodes(block, name, level, indexes)
+        indexes = [i for i, x, y in zip(indexes, nodes_a, nodes_b) if x != y]
+        if not indexes:
+            break
+        if level < depth:
+            indexes = [c for i in indexes for c in (2 * i, 2 * i + 1)]
+    return indexes
+
+
+def compare(args):
+    a = Node(args.node1)
+    b = Node(args.node2)
+    info_a = a.info()
+    info_b = b.info()
+    if info_a['prefix'] != info_b['prefix']:
+        raise Exception('the nodes use different bucket prefixes')
+    prefix = info_a['prefix']
+    depth = (len(ALPHABET) ** prefix).bit_length() - 1
+    trees_a = {t['block']: set(t['verifiers']) for t in info_a['trees']}
+    trees_b = {t['block']: set(t['verifiers']) for t in info_b['trees']}
+    blocks = set(trees_a) & set(trees_b)
+    if args.block:
+        blocks &= {str(args.block)}
+    if not blocks:
+        raise Exception('the nodes have no common block')
+    block = max(blocks, key=int)
+    print(f'block: {block}')
+    for name in sorted(trees_a[block] & trees_b[block]):
+        if args.verifier and name != args.verifier:
+            continue
+        indexes = divergent_buckets(a, b, block, name, depth)
+        print(f'{name}: {len(indexes)} divergent buckets')
+        for index in indexes:
+            users_a = a.bucket(block, name, prefix, index)
+            users_b = b.bucket(block, name, prefix, index)
+            for user in sorted(set(users_a) | set(users_b)):
+                if user not in users_b:
+                    print(f'  {user} only on {a.url}')
+                elif user not in users_a:
+                    print(f'  {user} only on {b.url}')
+                elif users_a[user] != users_b[user]:
+                    print(f'  {user} has different hashes')
+
+
+def prove(args):
+    node = Node(args.node)
+    info = node.info()
+    prefix = info['prefix']
+    depth = (len(ALPHABET) ** prefix).bit_length() - 1
+    blocks = [t['block'] for t in info['trees'] if args.verifier in t['verifiers']]
+    if args.block:
+        blocks = [b for b in blocks if b == str(args.block)]
+    if not blocks:
+        raise Exception(f'no tree of {args.verifier} is available')
+    block = max(blocks, key=int)
+    index = bucket(args.user, prefix)
+    users = node.bucket(block, args.verifier, prefix, index)
+    # siblings of the path from the bucket to the root
+    indexes = []
+    i = index
+    for level in range(depth, 0, -1):
+        indexes.append((level, i ^ 1))
+        i //= 2
+    path = [node.nodes(block, args.verifier, level, [i])[0]
+            for level, i in indexes]
+    root = node.nodes(block, args.verifier, 0, [0])[0]
+    node_hash = encode(leaf(users.values()))
+    print(f'block: {block}')
+    print(f'bucket: {index} ({bucket_prefix(index, prefix)})')
+    print(f'hash of {args.user}: {users.get(args.user)}')
+    print(f'leaf: {node_hash}')
+    print(f'proof: {" ".join(path)}')
+    print(f'root: {root}')
+    print(f'valid: {verify_proof(node_hash, index, path, root)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Find the verifications two nodes disagree on')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser(
+        'compare', help='list the users whose verifications differ')
+    p.add_argument('node1', help='ArangoDB url of the first node')
+    p.add_argument('node2', help='ArangoDB url of the second node')
+    p.add_argument('--block', type=int, default=None)
+    p.add_argument('--verifier', default=None)
+    p.set_defaults(func=compare)
+
+    p = subparsers.add_parser(
+        'prove', help="print the proof of a user's bucket")
+    p.add_argument('node', help='ArangoDB url of the node')
+    p.add_argument('verifier')
+    p.add_argument('user')
+    p.add_argument('--block', type=int, default=None)
+    p.set_defaults(func=prove)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,13 +4,13 @@ import json
 import time
 import shutil
 import traceback
-from arango import ArangoClient
-from hashlib import sha256
-import base64
 import config
+import database
 import verifications
+import merkle
+import snapshots
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
+db = database.db('_system')
 variables = db.collection('variables')
 verifiers = {
     'Seed': {'verifier': verifications.seed, 'step': 1},
@@ -23,83 +23,282 @@ verifiers = {
     'predefined': {'verifier': verifications.predefined, 'step': 1},
     'apps': {'verifier': verifications.apps, 'step': 1},
 }
+PROGRESS = 'SCORER_PROGRESS'
+CHANGES = 'VERIFICATIONS_CHANGES'
+# format of the hashes in VERIFICATIONS_HASHES; documents without a format
+# hold the sha256 of the sorted hashes (1) and this version publishes the
+# accumulator digests (2)
+HASHES_FORMAT = 2
 
 
 def update_verifications_hashes(block):
+    # the verifiers added the hashes of what they wrote to the accumulators
     new_hashes = {}
+    new_trees = {}
     for v in verifiers:
         if block % (config.SNAPSHOTS_PERIOD * verifiers[v]['step']) != 0 or v == 'apps':
             continue
-        verifications = db['verifications'].find({'name': v, 'block': block})
-        hashes = [v.get('hash', '') for v in verifications]
-        message = ''.join(sorted(hashes)).encode('ascii')
-        h = base64.b64encode(sha256(message).digest()).decode("ascii")
-        new_hashes[v] = h.replace(
-            '/', '_').replace('+', '-').replace('=', '')
+        accumulator = verifications.utils.accumulators.get(v)
+        if not accumulator:
+            accumulator = merkle.Accumulator(config.MERKLE_PREFIX_LENGTH)
+        new_hashes[v] = accumulator.digest()
+        new_trees[v] = accumulator.tree()
 
     # store hashes for only last 2 blocks
-    hashes = variables.get('VERIFICATIONS_HASHES')['hashes']
-    hashes = json.loads(hashes)
+    doc = variables.get('VERIFICATIONS_HASHES')
+    hashes = json.loads(doc['hashes'])
     # json save keys (block numbers) as strings
     last_block = str(max(map(int, hashes.keys())))
-    hashes = {block: new_hashes, last_block: hashes[last_block]}
+    # the hashes of another format can not be compared with the new ones
+    if doc.get('format', 1) == HASHES_FORMAT:
+        hashes = {block: new_hashes, last_block: hashes[last_block]}
+    else:
+        hashes = {block: new_hashes}
     variables.update({
         '_key': 'VERIFICATIONS_HASHES',
-        'hashes': json.dumps(hashes)
+        'hashes': json.dumps(hashes),
+        'format': HASHES_FORMAT
     })
+    update_verifications_merkle(block, last_block, new_trees)
+    update_verifications_changes(block, last_block)
+
+
+def update_verifications_merkle(block, last_block, new_trees):
+    # the trees are kept next to the hashes of the same blocks
+    trees = {str(block): new_trees}
+    doc = variables.get(merkle.VARIABLE)
+    if doc and doc.get('prefix') == config.MERKLE_PREFIX_LENGTH \
+            and last_block in doc['trees']:
+        trees[last_block] = doc['trees'][last_block]
+    db.aql.execute('''
+        UPSERT { _key: @key }
+        INSERT { _key: @key, prefix: @prefix, trees: @trees }
+        REPLACE { prefix: @prefix, trees: @trees }
+        IN variables
+    ''', bind_vars={
+        'key': merkle.VARIABLE,
+        'prefix': config.MERKLE_PREFIX_LENGTH,
+        'trees': trees
+    })
+
+
+REMOVE_EXPIRED = '''
+    FOR v IN verifications
+        FILTER  v.expired != null
+            AND v.expired <= @remove_border
+        REMOVE { _key: v._key } IN verifications OPTIONS { exclusive: true }
+'''
 
 
 def remove_verifications_before(block):
-    print(f'Removing verifications with block smaller than {block}')
+    print(f'Removing verifications expired before {block}')
+    db.aql.execute(REMOVE_EXPIRED, bind_vars={'remove_border': block})
+
+
+def save_progress(progress):
     db.aql.execute('''
-        FOR v IN verifications
-            FILTER  v.block < @remove_border
-            REMOVE { _key: v._key } IN verifications OPTIONS { exclusive: true }
-        ''', bind_vars={'remove_border': block})
+        UPSERT { _key: @progress._key }
+        INSERT @progress
+        REPLACE @progress
+        IN variables
+    ''', bind_vars={'progress': progress})
 
 
-def process(snapshot):
-    get_time = lambda: time.strftime('%Y-%m-%d %H:%M:%S')
-    get_block = lambda snapshot: int(snapshot.strip('dump_').strip('_fnl'))
+def restore_accumulators(block, names):
+    # the accumulators are rebuilt from the database only when the scorer
+    # restarted in the middle of a block
+    for name in names:
+        if name not in verifiers or name in verifications.utils.accumulators:
+            continue
+        cursor = database.query(db, '''
+            FOR v IN verifications
+                FILTER v.name == @name
+                    AND v.block <= @block
+                    AND (v.expired == null OR v.expired > @block)
+                    AND v.hash != null
+                RETURN [v.user, v.hash]
+        ''', bind_vars={'name': name, 'block': block})
+        verifications.utils.accumulators[name] = merkle.Accumulator(
+            config.MERKLE_PREFIX_LENGTH)
+        for user, h in cursor:
+            verifications.utils.add(name, user, h)
+
+
+REVERT_WRITTEN = '''
+    FOR v IN verifications
+        FILTER  v.block == @block
+            AND v.name NOT IN @names
+        REMOVE { _key: v._key } IN verifications
+'''
+REVERT_EXPIRED = '''
+    FOR v IN verifications
+        FILTER  v.expired == @block
+            AND v.name NOT IN @names
+        UPDATE v WITH { expired: null } IN verifications
+        OPTIONS { keepNull: false }
+'''
 
-    print(f'{get_time()} - processing {snapshot} started ...')
-    # restore snapshot
-    fname = os.path.join(config.SNAPSHOTS_PATH, snapshot)
-    res = os.system(f"arangorestore --server.username 'root' --server.password '' --server.endpoint 'tcp://{config.BN_ARANGO_HOST}:{config.BN_ARANGO_PORT}' --server.database snapshot --create-database true --create-collection true --import-data true --input-directory {fname} --threads 1")
-    assert res == 0, "restoring snapshot failed"
 
-    block = get_block(snapshot)
+def revert(block, names):
+    # undoes what the verifiers other than the named ones wrote for the block
+    bind_vars = {'block': block, 'names': names}
+    db.aql.execute(REVERT_WRITTEN, bind_vars=bind_vars)
+    db.aql.execute(REVERT_EXPIRED, bind_vars=bind_vars)
+
+
+def start_progress(block):
+    # the journal of the verifiers that completed for the block and the
+    # verifications they wrote by name; a retry of the block continues
+    # from the first verifier that did not complete
+    progress = variables.get(PROGRESS)
+    if progress and progress['block'] == block:
+        names = [name for outputs in progress['verifiers'].values()
+                 for name in outputs]
+        print(f'resuming after {len(progress["verifiers"])} verifiers')
+        # undo what the failed verifier wrote before failing
+        revert(block, names)
+        verifications.utils.reset(
+            block, progress['previous'], names, progress['changes'])
+        restore_accumulators(block, names)
+        return {k: progress[k] for k in (
+            '_key', 'block', 'previous', 'db', 'verifiers', 'changes')}
+
     # If there are verifications for current block, it means there was
-    # an error resulted in retrying the block. Remvoing these verifications
+    # an error resulted in retrying the block. Reverting these changes
     # helps not filling database and preventing unknown problems that
     # having duplicate verifications for same block may result in
+    revert(block, [])
+    previous = variables.get('VERIFICATION_BLOCK')['value']
+    verifications.utils.reset(block, previous)
+    progress = {
+        '_key': PROGRESS,
+        'block': block,
+        'previous': previous,
+        'db': snapshots.active,
+        'verifiers': {},
+        'changes': {}
+    }
+    save_progress(progress)
+    return progress
+
+
+EXPIRE_UNWRITTEN = '''
+    FOR v IN verifications
+        FILTER  v.block <= @previous
+            AND v.expired == null
+            AND v.name NOT IN @names
+        UPDATE v WITH { expired: @block } IN verifications
+        COLLECT name = OLD.name WITH COUNT INTO removed
+        RETURN [name, removed]
+'''
+
+
+def expire_unwritten(block, previous, names):
+    # expires the verifications of the previous block whose names were
+    # not written at all; the ones of verifiers that do not run for this
+    # block stay valid
+    cursor = db.aql.execute(EXPIRE_UNWRITTEN, bind_vars={
+        'block': block, 'previous': previous, 'names': names})
+    changes = verifications.utils.changes
+    for name, removed in cursor:
+        changes.setdefault(name, {'added': 0, 'changed': 0, 'removed': 0})
+        changes[name]['removed'] += removed
+
+
+def update_verifications_changes(block, last_block):
+    # the numbers of added, changed and removed verifications of each name
+    # for the last 2 blocks; the changes themselves are the verifications
+    # with the block (added or changed) or expired block (removed or
+    # replaced) of that block
+    doc = variables.get(CHANGES)
+    changes = {str(block): verifications.utils.changes}
+    if doc and last_block in doc['changes']:
+        changes[last_block] = doc['changes'][last_block]
+    db.aql.execute('''
+        UPSERT { _key: @key }
+        INSERT { _key: @key, changes: @changes }
+        REPLACE { changes: @changes }
+        IN variables
+    ''', bind_vars={'key': CHANGES, 'changes': changes})
+
+
+def migrate_verifications():
+    # verifications used to be written again for every block; the copies
+    # of the blocks before the last verified one are not needed anymore
+    if variables.has(CHANGES):
+        return
+    last_block = variables.get('VERIFICATION_BLOCK')['value']
+    print('removing the verifications of the blocks before '
+          f'{last_block} written in the old format')
     db.aql.execute('''
         FOR v IN verifications
-            FILTER  v.block == @block
+            FILTER  v.block < @last_block
             REMOVE { _key: v._key } IN verifications
-        ''', bind_vars={'block': block})
+        ''', bind_vars={'last_block': last_block})
+    if variables.has(PROGRESS):
+        variables.delete(PROGRESS)
+    variables.insert({'_key': CHANGES, 'changes': {}})
+
+
+def remove_snapshots_before(block):
+    for snapshot in os.listdir(config.SNAPSHOTS_PATH):
+        if snapshot.endswith('_done') and snapshots.get_block(snapshot) < block:
+            fname = os.path.join(config.SNAPSHOTS_PATH, snapshot)
+            shutil.rmtree(fname, ignore_errors=True)
+
+
+def process(snapshot):
+    get_time = lambda: time.strftime('%Y-%m-%d %H:%M:%S')
+
+    print(f'{get_time()} - processing {snapshot} started ...')
+    fname = os.path.join(config.SNAPSHOTS_PATH, snapshot)
+    snapshots.load(fname)
+
+    block = snapshots.get_block(snapshot)
+    progress = start_progress(block)
+    # the journal records the database of the block before the other
+    # database starts loading the next one
+    snapshots.prefetch(block)
     for v in verifiers:
         if block % (config.SNAPSHOTS_PERIOD * verifiers[v]['step']) != 0:
             continue
+        if v in progress['verifiers']:
+            continue
+        before = set(verifications.utils.counts)
         verifiers[v]['verifier'].verify(block)
+        progress['verifiers'][v] = {
+            name: count for name, count in verifications.utils.counts.items()
+            if name not in before
+        }
+        verifications.utils.finish(progress['verifiers'][v])
+        progress['changes'] = verifications.utils.changes
+        save_progress(progress)
+
+    # names of the verifiers that did not run for this block are kept too
+    names = [name for outputs in progress['verifiers'].values()
+             for name in outputs]
+    names += [v for v in verifiers
+              if block % (config.SNAPSHOTS_PERIOD * verifiers[v]['step']) != 0]
+    expire_unwritten(block, progress['previous'], names)
 
     update_verifications_hashes(block)
     last_block = variables.get('VERIFICATION_BLOCK')['value']
     # only keep verifications for this snapshot and previous one
     remove_verifications_before(last_block)
     variables.update({'_key': 'VERIFICATION_BLOCK', 'value': block})
-    # remove the snapshot file
-    shutil.rmtree(fname, ignore_errors=True)
+    # the snapshot is kept as the base of the next deltas until a newer
+    # full snapshot is processed
+    done = fname[:-len('_fnl')] + '_done'
+    with snapshots.lock:
+        os.rename(fname, done)
+        if not snapshots.is_delta(done):
+            remove_snapshots_before(block)
     print(f'{get_time()} - processing {fname} completed')
 
 
 def next_snapshot():
-    is_final = lambda snapshot: snapshot.endswith('_fnl')
-    get_block = lambda snapshot: int(snapshot.strip('dump_').strip('_fnl'))
     while True:
-        snapshots = os.listdir(config.SNAPSHOTS_PATH)
-        snapshots.sort(key=get_block)
-        snapshot = next(filter(is_final, snapshots), None)
+        snapshot = snapshots.next_final()
         if snapshot:
             return snapshot
         time.sleep(1)
@@ -128,6 +327,11 @@ def main():
     print('waiting for db ...')
     wait()
     print('db started')
+    database.ensure_indexes('_system', config.INDEXES)
+    migrate_verifications()
+    progress = variables.get(PROGRESS)
+    if progress:
+        snapshots.resume(progress['db'], progress['block'])
     while True:
         snapshot = next_snapshot()
         try:
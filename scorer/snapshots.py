@@ -0,0 +1,167 @@
+# The snapshots are loaded in two databases by turns. While the verifiers
+# read the active one, the next final snapshot is loaded in the other one in
+# the background. Each database remembers the block it holds, so it usually
+# catches up by applying the deltas after that block instead of a restore.
+import os
+import json
+import time
+import threading
+import traceback
+import config
+import database
+
+# the block of the snapshot that is loaded in each database; None while
+# it is being loaded
+blocks = {name: None for name in config.SNAPSHOT_DBS}
+active = config.SNAPSHOT_DBS[0]
+# held while a database is loaded so the runner does not rename or remove
+# the snapshots that are being read
+lock = threading.Lock()
+prefetcher = None
+
+
+def get_block(snapshot):
+    return int(snapshot.split('_')[1])
+
+
+def is_delta(fname):
+    return os.path.exists(os.path.join(fname, 'delta.json'))
+
+
+def db():
+    return database.db(active)
+
+
+def spare():
+    return next(name for name in config.SNAPSHOT_DBS if name != active)
+
+
+def next_final(after=0):
+    is_final = lambda snapshot: snapshot.endswith('_fnl')
+    snapshots = [s for s in os.listdir(
+        config.SNAPSHOTS_PATH) if s.startswith('dump_')]
+    snapshots.sort(key=get_block)
+    return next((s for s in snapshots
+                 if is_final(s) and get_block(s) > after), None)
+
+
+def restore(name, fname):
+    res = os.system(f"arangorestore --server.username 'root' --server.password '' --server.endpoint 'tcp://{config.BN_ARANGO_HOST}:{config.BN_ARANGO_PORT}' --server.database {name} --create-database true --create-collection true --import-data true --input-directory {fname} --threads {config.RESTORE_THREADS}")
+    assert res == 0, "restoring snapshot failed"
+    # arangorestore builds the indexes of the dump after loading the data
+    # and these ones are built after the whole restore too
+    database.ensure_indexes(name, config.SNAPSHOT_INDEXES)
+
+
+def apply_delta(name, fname):
+    snapshot_db = database.db(name)
+    for f in os.listdir(fname):
+        if not f.endswith('.delta.json'):
+            continue
+        collection = f[:-len('.delta.json')]
+        upserts = []
+        removes = []
+        with open(os.path.join(fname, f)) as delta:
+            for line in delta:
+                change = json.loads(line)
+                if change['type'] == 'remove':
+                    removes.append(change['key'])
+                    continue
+                doc = change['data']
+                upserts.append({k: doc[k] for k in doc if k not in (
+                    '_id', '_rev')})
+        for i in range(0, len(upserts), 1000):
+            snapshot_db[collection].import_bulk(
+                upserts[i:i + 1000], on_duplicate='replace')
+        for i in range(0, len(removes), 1000):
+            snapshot_db.aql.execute('''
+                FOR k IN @keys
+                    REMOVE k IN @@collection OPTIONS { ignoreErrors: true }
+            ''', bind_vars={
+                'keys': removes[i:i + 1000],
+                '@collection': collection
+            })
+
+
+def snapshot_chain(block):
+    # the full snapshot and deltas that can rebuild the block; the
+    # snapshot that is being verified is not done yet
+    chain = []
+    while True:
+        fname = None
+        for suffix in ('_fnl', '_done'):
+            path = os.path.join(config.SNAPSHOTS_PATH, f'dump_{block}{suffix}')
+            if os.path.exists(path):
+                fname = path
+        if not fname:
+            raise Exception(f'snapshot of block {block} is not available')
+        chain.insert(0, fname)
+        if not is_delta(fname):
+            return chain
+        with open(os.path.join(fname, 'delta.json')) as f:
+            block = json.load(f)['base']
+
+
+def resume(name, block):
+    # the database held the block when the scorer stopped
+    global active
+    blocks[name] = block
+    active = name
+
+
+def prepare(name, fname):
+    # brings the database to the block of the snapshot
+    block = get_block(os.path.basename(fname))
+    if blocks[name] == block:
+        return
+    with lock:
+        chain = snapshot_chain(block)
+        chain_blocks = [get_block(os.path.basename(c)) for c in chain]
+        current = blocks[name]
+        blocks[name] = None
+        if current in chain_blocks:
+            start = chain_blocks.index(current) + 1
+        else:
+            print(f'restoring snapshot of block {chain_blocks[0]} in {name}')
+            restore(name, chain[0])
+            start = 1
+        for delta in chain[start:]:
+            apply_delta(name, delta)
+        blocks[name] = block
+
+
+def load(fname):
+    # makes the database that holds the snapshot the active one
+    global active
+    block = get_block(os.path.basename(fname))
+    if blocks[active] == block:
+        return
+    if prefetcher:
+        prefetcher.join()
+    name = spare()
+    if blocks[name] != block:
+        prepare(name, fname)
+    active = name
+
+
+def prefetch(after):
+    # loads the next final snapshot in the spare database while the
+    # active one is being verified
+    global prefetcher
+    if prefetcher and prefetcher.is_alive():
+        return
+    name = spare()
+
+    def run():
+        snapshot = next_final(after)
+        while not snapshot:
+            time.sleep(1)
+            snapshot = next_final(after)
+        try:
+            prepare(name, os.path.join(config.SNAPSHOTS_PATH, snapshot))
+        except Exception as e:
+            print(f'Error in loading {snapshot} in {name}: {e}')
+            traceback.print_exc()
+
+    prefetcher = threading.Thread(target=run, daemon=True)
+    prefetcher.start()
@@ -0,0 +1,112 @@
+import os
+os.environ.setdefault('BN_ARANGO_PROTOCOL', 'http')
+os.environ.setdefault('BN_ARANGO_HOST', 'localhost')
+os.environ.setdefault('BN_ARANGO_PORT', '8529')
+os.environ.setdefault('BN_CONSENSUS_SNAPSHOTS_PERIOD', '240')
+
+import unittest
+import tempfile
+import dbtest
+import graphfile
+from verifications import seed, social_recovery_setup
+
+USERS = ['u1', 'u2', 'u3', 'u4', 'u5', 'u6']
+# (from, to, level, timestamp); u7 has no user document but its
+# connections are in the snapshot database
+CONNECTIONS = [
+    ('u1', 'u2', 'recovery', 1), ('u1', 'u3', 'recovery', 2),
+    ('u1', 'u4', 'recovery', 3), ('u2', 'u1', 'just met', 4),
+    ('u7', 'u1', 'recovery', 5), ('u7', 'u2', 'recovery', 6),
+    ('u7', 'u3', 'recovery', 7), ('u6', 'u1', 'recovery', 8),
+    ('u6', 'u2', 'recovery', 9), ('u3', 'u5', 'unknown', 10),
+]
+# group: seed
+GROUPS = {'g1': True, 'g2': False, 'g3': 'true'}
+# (user, group)
+MEMBERSHIPS = [
+    ('u1', 'g1'), ('u2', 'g1'), ('u3', 'g2'), ('u4', 'g3'), ('u8', 'g1'),
+]
+
+
+def write_graph(fpath):
+    graphfile.write(fpath, USERS, CONNECTIONS,
+                    [g for g, s in GROUPS.items() if s is True], MEMBERSHIPS)
+
+
+class TestGraphFile(unittest.TestCase):
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as d:
+            fpath = os.path.join(d, 'graph.bin')
+            write_graph(fpath)
+            g = graphfile.Graph(fpath)
+            users = [g.user(i) for i in range(g.num_users)]
+            self.assertEqual(users, sorted(set(USERS) | {'u7', 'u8'}))
+            connections = sorted(
+                (g.user(f), g.user(t), graphfile.LEVELS[l]
+                 if l < len(graphfile.LEVELS) else None, ts)
+                for f, t, l, ts in zip(g.conn_from, g.conn_to, g.conn_level,
+                                       g.conn_timestamp))
+            expected = sorted(
+                (f, t, l if l in graphfile.LEVELS else None, ts)
+                for f, t, l, ts in CONNECTIONS)
+            self.assertEqual(connections, expected)
+            members = sorted((g.user(u), g.group(i))
+                             for u, i in zip(g.member_user, g.member_group))
+            self.assertEqual(members, [('u1', 'g1'), ('u2', 'g1'),
+                                       ('u8', 'g1')])
+
+    def test_unsupported_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            fpath = os.path.join(d, 'graph.bin')
+            with open(fpath, 'wb') as f:
+                f.write(graphfile.HEADER.pack(b'XXXX', graphfile.VERSION, 0))
+            with self.assertRaises(ValueError):
+                graphfile.Graph(fpath)
+
+
+class TestGraphQueries(dbtest.TemporaryDatabase, unittest.TestCase):
+    # the verifiers that read graph.bin must verify the same users as
+    # their queries of the snapshot database
+    collections = {
+        'users': False,
+        'groups': False,
+        'connections': True,
+        'usersInGroups': True,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.db['users'].import_bulk([{'_key': u} for u in USERS])
+        cls.db['connections'].import_bulk([{
+            '_from': f'users/{f}', '_to': f'users/{t}', 'level': l,
+            'timestamp': ts
+        } for f, t, l, ts in CONNECTIONS])
+        cls.db['groups'].import_bulk([{'_key': g, 'seed': s}
+                                      for g, s in GROUPS.items()])
+        cls.db['usersInGroups'].import_bulk([{
+            '_from': f'users/{u}', '_to': f'groups/{g}'
+        } for u, g in MEMBERSHIPS])
+        cls.dir = tempfile.TemporaryDirectory()
+        fpath = os.path.join(cls.dir.name, 'graph.bin')
+        write_graph(fpath)
+        cls.graph = graphfile.Graph(fpath)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+        super().tearDownClass()
+
+    def test_social_recovery_setup(self):
+        self.assertEqual(
+            sorted(social_recovery_setup.recovery_setups(self.graph)),
+            sorted(social_recovery_setup.query_recovery_setups(self.db)))
+
+    def test_seed(self):
+        self.assertEqual(sorted(seed.graph_seeds(self.graph)),
+                         sorted(seed.query_seeds(self.db)))
+
+
+if __name__ == '__main__':
+    unittest.main()
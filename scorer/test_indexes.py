@@ -0,0 +1,54 @@
+import os
+os.environ.setdefault('BN_ARANGO_PROTOCOL', 'http')
+os.environ.setdefault('BN_ARANGO_HOST', 'localhost')
+os.environ.setdefault('BN_ARANGO_PORT', '8529')
+os.environ.setdefault('BN_CONSENSUS_SNAPSHOTS_PERIOD', '240')
+
+import unittest
+import config
+import dbtest
+import merkle
+import runner
+from verifications import (
+    apps, brightid, dollar_for_everyone, seed, seed_connected,
+    seed_connected_with_friend, social_recovery_setup, utils)
+
+
+class TestIndexes(dbtest.IndexTests, unittest.TestCase):
+    collections = {
+        'verifications': False,
+        'users': False,
+        'groups': False,
+        'usersInGroups': True,
+        'connections': True,
+    }
+    indexes = config.INDEXES + config.SNAPSHOT_INDEXES
+    queries = [
+        (runner.REVERT_WRITTEN, {'block': 1, 'names': []}),
+        (runner.REVERT_EXPIRED, {'block': 1, 'names': []}),
+        (runner.EXPIRE_UNWRITTEN, {'block': 2, 'previous': 1, 'names': []}),
+        (runner.REMOVE_EXPIRED, {'remove_border': 1}),
+        (brightid.SEED_CONNECTEDS, {'block': 1}),
+        (seed_connected.LAST_VERIFICATIONS, {'block': 1}),
+        (seed_connected_with_friend.SEED_CONNECTEDS, {'block': 1}),
+        (utils.PREVIOUS_VERIFICATIONS, {'name': 'Seed', 'previous': 1}),
+        (apps.USER_VERIFICATIONS, {'block': 1, 'user': 'u'}),
+        (merkle.BUCKET, {'name': 'BrightID', 'block': 1, 'length': 2,
+                         'prefix': 'AA'}),
+        # queries of the snapshot database
+        (seed.SEEDS, {}),
+        (dollar_for_everyone.ADMINS, {}),
+        (dollar_for_everyone.VERIFIEDS, {
+            'admins': ['users/a'], 'levels': ['just met'], 'time_limit': 1}),
+        (seed_connected.SEED_CONNECTIONS, {
+            'after': 1, 'members': ['users/a']}),
+        (seed_connected_with_friend.SEED_CONNECTIONS, {
+            'seed': 'users/a', 'levels': ['just met'], 'time_border': 1}),
+        (seed_connected_with_friend.CONNECTION, {
+            'from': 'users/a', 'to': 'users/b'}),
+        (social_recovery_setup.RECOVERY_SETUPS, {}),
+    ]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import random
+import merkle
+
+PREFIX = 1
+DEPTH = (len(merkle.ALPHABET) ** PREFIX).bit_length() - 1
+VERIFICATIONS = [
+    ('AAbc', 'h1'), ('Abcd', 'h2'), ('b-_x', 'h3'), ('_zzz', 'h4'),
+    ('A123', 'h5'), ('9xyz', 'h6'),
+]
+
+
+def accumulate(verifications):
+    accumulator = merkle.Accumulator(PREFIX)
+    for user, h in verifications:
+        accumulator.add(user, h)
+    return accumulator
+
+
+def proof(levels, index):
+    # siblings of the path from the bucket to the root
+    path = []
+    for level in range(DEPTH, 0, -1):
+        path.append(levels[level][index ^ 1])
+        index //= 2
+    return path
+
+
+class TestBuckets(unittest.TestCase):
+
+    def test_round_trip(self):
+        for prefix in (1, 2):
+            for index in range(len(merkle.ALPHABET) ** prefix):
+                p = merkle.bucket_prefix(index, prefix)
+                self.assertEqual(len(p), prefix)
+                self.assertEqual(merkle.bucket(p, prefix), index)
+
+    def test_bucket(self):
+        self.assertEqual(merkle.bucket('Abcd', 1), 0)
+        self.assertEqual(merkle.bucket('_zzz', 1), 63)
+        self.assertEqual(merkle.bucket('bA', 2), 27 * 64)
+        # short keys are padded and unknown characters go to the first bucket
+        self.assertEqual(merkle.bucket('b', 2), 27 * 64)
+        self.assertEqual(merkle.bucket('', 2), 0)
+        self.assertEqual(merkle.bucket('=b', 2), 27)
+
+
+class TestAccumulator(unittest.TestCase):
+
+    def test_order_independent(self):
+        shuffled = VERIFICATIONS[:]
+        random.shuffle(shuffled)
+        a = accumulate(VERIFICATIONS)
+        b = accumulate(shuffled)
+        self.assertEqual(a.digest(), b.digest())
+        self.assertEqual(a.tree(), b.tree())
+
+    def test_digest(self):
+        self.assertEqual(
+            accumulate(VERIFICATIONS).digest(),
+            merkle.encode(merkle.leaf(h for _, h in VERIFICATIONS)))
+        self.assertNotEqual(accumulate(VERIFICATIONS).digest(),
+                            accumulate(VERIFICATIONS[1:]).digest())
+
+    def test_tree(self):
+        levels = accumulate(VERIFICATIONS).tree()
+        self.assertEqual(len(levels), DEPTH + 1)
+        self.assertEqual([len(level) for level in levels],
+                         [2 ** d for d in range(DEPTH + 1)])
+        # the leaves are the sums of the buckets' hashes
+        for index, node in enumerate(levels[-1]):
+            hashes = [h for user, h in VERIFICATIONS
+                      if merkle.bucket(user, PREFIX) == index]
+            self.assertEqual(node, merkle.encode(merkle.leaf(hashes)))
+        for depth in range(DEPTH):
+            for i, node in enumerate(levels[depth]):
+                children = levels[depth + 1][2 * i:2 * i + 2]
+                self.assertEqual(
+                    node, merkle.encode(merkle.parent(*children)))
+
+    def test_empty_tree(self):
+        levels = merkle.Accumulator(PREFIX).tree()
+        empty = merkle.encode(merkle.to_bytes(0))
+        self.assertEqual(set(levels[-1]), {empty})
+
+
+class TestProof(unittest.TestCase):
+
+    def setUp(self):
+        self.levels = accumulate(VERIFICATIONS).tree()
+        self.root = self.levels[0][0]
+
+    def test_valid(self):
+        for user, h in VERIFICATIONS:
+            index = merkle.bucket(user, PREFIX)
+            hashes = [h for u, h in VERIFICATIONS
+                      if merkle.bucket(u, PREFIX) == index]
+            node = merkle.encode(merkle.leaf(hashes))
+            self.assertTrue(merkle.verify_proof(
+                node, index, proof(self.levels, index), self.root))
+
+    def test_invalid(self):
+        index = merkle.bucket('AAbc', PREFIX)
+        path = proof(self.levels, index)
+        node = self.levels[-1][index]
+        # a missing hash, a wrong index and a changed sibling
+        missing = merkle.encode(merkle.leaf(['h1', 'h2']))
+        self.assertFalse(
+            merkle.verify_proof(missing, index, path, self.root))
+        self.assertFalse(
+            merkle.verify_proof(node, index + 1, path, self.root))
+        path[0] = merkle.encode(merkle.leaf(['h7']))
+        self.assertFalse(merkle.verify_proof(node, index, path, self.root))
+
+
+if __name__ == '__main__':
+    unittest.main()
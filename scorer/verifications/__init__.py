@@ -6,4 +6,5 @@ from . import yekta
 from . import social_recovery_setup
 from . import apps
 from . import seed
-from . import predefined
\ No newline at end of file
+from . import predefined
+from . import utils
\ No newline at end of file
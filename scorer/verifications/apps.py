@@ -1,12 +1,21 @@
 import time
-from arango import ArangoClient
 from py_expression_eval import Parser
-import config
+from . import utils
+import database
+
+USER_VERIFICATIONS = '''
+    FOR v IN verifications
+        FILTER v.user == @user
+            AND v.block <= @block
+            AND (v.expired == null OR v.expired > @block)
+            AND v.expression != true
+        RETURN v
+'''
 
 
 def verify(block):
     print('Update verifications for apps')
-    db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
+    db = database.db('_system')
     parser = Parser()
     expressions = {}
     for app in db['apps']:
@@ -26,7 +35,9 @@ def verify(block):
     counter = 0
     for user in db['users']:
         verifications = {}
-        for v in db['verifications'].find({'block': block, 'user': user['_key']}):
+        cursor = db.aql.execute(USER_VERIFICATIONS, bind_vars={
+            'block': block, 'user': user['_key']})
+        for v in cursor:
             verifications[v['name']] = True
             for k in v:
                 if k in ['_key', '_id', '_rev', 'user', 'name']:
@@ -43,7 +54,7 @@ def verify(block):
                 continue
 
             if verified:
-                batch_col.insert({
+                utils.insert(batch_col, {
                     'expression': True,
                     'name': key,
                     'user': user['_key'],
@@ -1,24 +1,26 @@
 import time
-from arango import ArangoClient
 from . import utils
-import config
+import database
+
+SEED_CONNECTEDS = '''
+    FOR v in verifications
+        FILTER v.name == 'SeedConnected'
+            AND v.rank > 0
+            AND v.block <= @block
+            AND (v.expired == null OR v.expired > @block)
+        RETURN v.user
+'''
 
 
 def verify(block):
     print('BRIGHTID')
-    db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
-    verifieds = db.aql.execute('''
-        FOR v in verifications
-            FILTER v.name == 'SeedConnected'
-                AND v.rank > 0
-                AND v.block == @block
-            RETURN v.user
-    ''', bind_vars={'block': block})
+    db = database.db('_system')
+    verifieds = database.query(db, SEED_CONNECTEDS, bind_vars={'block': block})
 
     batch_db = db.begin_batch_execution(return_result=True)
     verifications = batch_db.collection('verifications')
     for i, verified in enumerate(verifieds):
-        verifications.insert({
+        utils.insert(verifications, {
             'name': 'BrightID',
             'user': verified,
             'block': block,
@@ -1,22 +1,29 @@
 import time
-from arango import ArangoClient
 from . import utils
-import config
+import database
+import snapshots
+
+ADMINS = '''
+    FOR u IN users
+        FILTER u.dfeAdmin == true
+        RETURN u._id
+'''
+VERIFIEDS = '''
+    FOR c IN connections
+        FILTER c._from IN @admins
+            AND c.level IN @levels
+            AND c.timestamp > @time_limit
+            RETURN c._to
+'''
 
 
 def verify(block):
     print('DOLLAR FOR EVERYONE')
-    db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
-    snapshot_db = ArangoClient(hosts=config.ARANGO_SERVER).db('snapshot')
+    db = database.db('_system')
+    snapshot_db = snapshots.db()
 
-    admins = [u['_id'] for u in snapshot_db['users'].find({'dfeAdmin': True})]
-    verifieds = snapshot_db.aql.execute('''
-        FOR c IN connections
-            FILTER c._from IN @admins
-                AND c.level IN @levels
-                AND c.timestamp > @time_limit
-                RETURN c._to
-    ''', bind_vars={
+    admins = list(snapshot_db.aql.execute(ADMINS))
+    verifieds = database.query(snapshot_db, VERIFIEDS, bind_vars={
         'admins': admins,
         'levels': ['just met', 'already known', 'recovery'],
         'time_limit': 1564600000000
@@ -24,7 +31,7 @@ def verify(block):
     counter = 0
     for verified in verifieds:
         verified = verified.replace('users/', '')
-        db['verifications'].insert({
+        utils.insert(db['verifications'], {
             'name': 'DollarForEveryone',
             'user': verified,
             'block': block,
@@ -1,12 +1,10 @@
-from arango import ArangoClient
 import time
 from . import utils
-import config
+import database
 import requests
 import json
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
-snapshot_db = ArangoClient(hosts=config.ARANGO_SERVER).db('snapshot')
+db = database.db('_system')
 
 files = [
     {'url': 'https://explorer.brightid.org/history/bitu.json', 'rank': 'score'},
@@ -32,7 +30,7 @@ def verify(block):
             v['timestamp'] = int(time.time() * 1000)
             v['hash'] = utils.hash(v['name'], v['user'],
                                    v.get(file['rank'], ''))
-            batch_col.insert(v)
+            utils.insert(batch_col, v)
             counter += 1
             if counter % 1000 == 0:
                 batch_db.commit()
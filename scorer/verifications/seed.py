@@ -1,29 +1,42 @@
-from arango import ArangoClient
 import time
 from . import utils
-import config
+import database
+import snapshots
+import graph
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
-snapshot_db = ArangoClient(hosts=config.ARANGO_SERVER).db('snapshot')
+db = database.db('_system')
+# the query of the snapshot database when there is no graph.bin
+SEEDS = '''
+    FOR g in groups
+        FILTER g.seed == true
+        FOR ug in usersInGroups
+            FILTER ug._to == g._id
+            RETURN DISTINCT ug._from
+'''
+
+
+def graph_seeds(g):
+    # graph.bin only has the memberships of seed groups
+    return sorted({g.user(u) for u in g.member_user})
+
+
+def query_seeds(snapshot_db):
+    return [s.replace('users/', '') for s in snapshot_db.aql.execute(SEEDS)]
 
 
 def verify(block):
     print('SEED')
-
-    seeds = snapshot_db.aql.execute('''
-        FOR g in groups
-            FILTER g.seed == true
-            FOR ug in usersInGroups
-                FILTER ug._to == g._id
-                RETURN DISTINCT ug._from
-    ''')
+    g = graph.load(block)
+    if g:
+        seeds = graph_seeds(g)
+    else:
+        seeds = query_seeds(snapshots.db())
 
     batch_db = db.begin_batch_execution(return_result=True)
     batch_col = batch_db.collection('verifications')
     counter = 0
-    for s in seeds:
-        seed = s.replace('users/', '')
-        batch_col.insert({
+    for seed in seeds:
+        utils.insert(batch_col, {
             'name': 'Seed',
             'user': seed,
             'block': block,
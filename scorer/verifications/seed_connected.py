@@ -1,40 +1,48 @@
-from arango import ArangoClient
 import time
 from . import utils
-import config
+import database
+import snapshots
 
 PENALTY = 3
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
-snapshot_db = ArangoClient(hosts=config.ARANGO_SERVER).db('snapshot')
+db = database.db('_system')
+
+
+SEED_CONNECTIONS = '''
+    FOR c in connections
+        FILTER c._from IN @members
+            AND (c.timestamp > @after OR c.level == 'reported')
+        SORT c.timestamp, c._from, c._to ASC
+        RETURN c
+'''
+LAST_VERIFICATIONS = '''
+    FOR v in verifications
+        FILTER v.name == 'SeedConnected'
+            AND v.block <= @block
+            AND (v.expired == null OR v.expired > @block)
+        RETURN v
+'''
 
 
 def seed_connections(group_id, after):
+    snapshot_db = snapshots.db()
     cursor = snapshot_db['usersInGroups'].find({'_to': group_id})
     members = [ug['_from'] for ug in cursor]
-    return snapshot_db.aql.execute('''
-        FOR c in connections
-            FILTER c._from IN @members
-                AND (c.timestamp > @after OR c.level == 'reported')
-            SORT c.timestamp, c._from, c._to ASC
-            RETURN c
-    ''', bind_vars={'after': after, 'members': members})
+    return database.query(snapshot_db, SEED_CONNECTIONS,
+                          bind_vars={'after': after, 'members': members})
 
 
 def last_verifications():
     last_block = db['variables'].get('VERIFICATION_BLOCK')['value']
-    cursor = db.aql.execute('''
-        FOR v in verifications
-            FILTER v.name == 'SeedConnected'
-                AND v.block == @block
-            RETURN v
-    ''', bind_vars={'block': last_block})
+    cursor = database.query(db, LAST_VERIFICATIONS,
+                            bind_vars={'block': last_block})
     verifications = {v['user']: v for v in cursor}
     return verifications
 
 
 def verify(block):
     print('SEED CONNECTED')
+    snapshot_db = snapshots.db()
     users = last_verifications()
 
     # find number of users each seed group verified
@@ -83,7 +91,7 @@ def verify(block):
     for u, d in users.items():
         # penalizing users that are reported by seeds
         rank = len(d['connected']) - len(d['reported']) * PENALTY
-        verifications_col.insert({
+        utils.insert(verifications_col, {
             'name': 'SeedConnected',
             'user': u,
             'rank': rank,
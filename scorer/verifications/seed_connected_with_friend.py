@@ -1,23 +1,42 @@
-from arango import ArangoClient
 import itertools
 import time
 from . import utils
-import config
+from . import seed
+import database
+import snapshots
 
 SEED_CONNECTION_LEVELS = ['just met', 'already known', 'recovery']
 FRIEND_CONNECTION_LEVELS = ['already known', 'recovery']
 CONN_DIFF_TIME = 60 * 60 * 1000
 GO_BACK_TIME = 6 * 60 * 60 * 1000  # 6 hours
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
-snapshot_db = ArangoClient(hosts=config.ARANGO_SERVER).db('snapshot')
+db = database.db('_system')
 verifieds = set()
+SEED_CONNECTEDS = '''
+    FOR v IN verifications
+        FILTER v.name == 'SeedConnected'
+            AND v.block <= @block
+            AND (v.expired == null OR v.expired > @block)
+        RETURN v
+'''
+SEED_CONNECTIONS = '''
+    FOR c IN connections
+        FILTER c._from == @seed
+            AND c.level IN @levels
+            AND c.timestamp > @time_border
+            RETURN c
+'''
+CONNECTION = '''
+    FOR c IN connections
+        FILTER c._from == @from AND c._to == @to
+        RETURN c.level
+'''
 
 
 def add_verification_to(user, friend, block, batch_col):
     if user in verifieds:
         return
-    batch_col.insert({
+    utils.insert(batch_col, {
         'name': 'SeedConnectedWithFriend',
         'user': user,
         'friend': friend,
@@ -29,27 +48,25 @@ def add_verification_to(user, friend, block, batch_col):
 
 
 def get_seeds():
-    cursor = snapshot_db.aql.execute('''
-        FOR g in groups
-            FILTER g.seed == true
-            FOR ug in usersInGroups
-                FILTER ug._to == g._id
-                RETURN DISTINCT ug._from
-    ''')
-    seeds = set(s.replace('users/', '') for s in cursor)
-    return seeds
+    return set(seed.query_seeds(snapshots.db()))
 
 
 def get_seed_connecteds(block):
-    cursor = db['verifications'].find(
-        {'name': 'SeedConnected', 'block': block})
+    cursor = db.aql.execute(SEED_CONNECTEDS, bind_vars={'block': block})
     return set(v['user'] for v in cursor if v.get('rank', 0) > 0)
 
 
+def are_friends(snapshot_db, user, friend):
+    cursor = snapshot_db.aql.execute(CONNECTION, bind_vars={
+        'from': 'users/' + user, 'to': 'users/' + friend})
+    return not cursor.empty() and cursor.next() in FRIEND_CONNECTION_LEVELS
+
+
 def verify(block):
     global verifieds
 
     print('SEED CONNECTED WITH FRIEND')
+    snapshot_db = snapshots.db()
     verifieds = set()
     time_border = (int(time.time()) * 1000) - GO_BACK_TIME
     seeds = get_seeds()
@@ -59,23 +76,18 @@ def verify(block):
     batch_col = batch_db.collection('verifications')
 
     # verify already verified users if they are still SeedConnected
-    for v in db['verifications'].find({'name': 'SeedConnectedWithFriend'}):
+    previous = utils.load_previous('SeedConnectedWithFriend')
+    for v in previous.values():
         if v['user'] in seed_connecteds:
             add_verification_to(v['user'], v['friend'], block, batch_col)
 
     # verify new users
-    for seed in seeds:
+    for s in seeds:
         # seeds get verified by default
-        add_verification_to(seed, None, block, batch_col)
+        add_verification_to(s, None, block, batch_col)
         # find users that seed connected to them recently
-        conns = snapshot_db.aql.execute('''
-            FOR c IN connections
-                FILTER c._from == @seed
-                    AND c.level IN @levels
-                    AND c.timestamp > @time_border
-                    RETURN c
-        ''', bind_vars={
-            'seed': 'users/' + seed,
+        conns = snapshot_db.aql.execute(SEED_CONNECTIONS, bind_vars={
+            'seed': 'users/' + s,
             'levels': SEED_CONNECTION_LEVELS,
             'time_border': time_border
         })
@@ -102,14 +114,9 @@ def verify(block):
                 continue
 
             # skip if pair sides are not friends
-            ft = snapshot_db['connections'].find(
-                {'_from': 'users/' + pair[0], '_to': 'users/' + pair[1]})
-            if ft.empty() or ft.next()['level'] not in FRIEND_CONNECTION_LEVELS:
+            if not are_friends(snapshot_db, pair[0], pair[1]):
                 continue
-
-            tf = snapshot_db['connections'].find(
-                {'_from': 'users/' + pair[1], '_to': 'users/' + pair[0]})
-            if tf.empty() or tf.next()['level'] not in FRIEND_CONNECTION_LEVELS:
+            if not are_friends(snapshot_db, pair[1], pair[0]):
                 continue
 
             # verify both sides (if not verified)
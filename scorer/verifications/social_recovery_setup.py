@@ -1,27 +1,47 @@
 import time
-from arango import ArangoClient
 from . import utils
-import config
+import database
+import snapshots
+import graph
+
+RECOVERY_LEVEL = graph.LEVELS.index('recovery')
+# the query of the snapshot database when there is no graph.bin
+RECOVERY_SETUPS = '''
+    FOR c IN connections
+        FILTER c.level == 'recovery'
+        COLLECT user = c._from WITH COUNT INTO length
+        Filter length > 2
+        RETURN REGEX_REPLACE(user, 'users/', '')
+'''
+
+
+def recovery_setups(g):
+    counts = {}
+    for f, level in zip(g.conn_from, g.conn_level):
+        if level == RECOVERY_LEVEL:
+            counts[f] = counts.get(f, 0) + 1
+    return [g.user(u) for u, length in counts.items() if length > 2]
+
+
+def query_recovery_setups(snapshot_db):
+    return snapshot_db.aql.execute(RECOVERY_SETUPS)
 
 
 def verify(block):
     print('SOCIAL RECOVERY SETUP')
-    db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
-    snapshot_db = ArangoClient(hosts=config.ARANGO_SERVER).db('snapshot')
-    verifieds = snapshot_db.aql.execute('''
-        FOR c IN connections
-            FILTER c.level == 'recovery'
-            COLLECT user = c._from WITH COUNT INTO length
-            Filter length > 2
-            RETURN REGEX_REPLACE(user, 'users/', '')
-    ''')
+    db = database.db('_system')
+    g = graph.load(block)
+    if g:
+        verifieds = recovery_setups(g)
+    else:
+        verifieds = query_recovery_setups(snapshots.db())
 
     batch_db = db.begin_batch_execution(return_result=True)
     verifications = batch_db.collection('verifications')
     i = 0
     for verified in verifieds:
         i += 1
-        verifications.insert({
+        utils.insert(verifications, {
             'name': 'SocialRecoverySetup',
             'user': verified,
             'block': block,
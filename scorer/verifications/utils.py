@@ -1,8 +1,109 @@
 import base64
 from hashlib import sha256
+import config
+import database
+import merkle
+
+# a verification is valid from its block until its expired block, so only
+# the verifications that differ from the previous block are written; an
+# unchanged verification keeps the block and timestamp it was first
+# written with
+IGNORED_FIELDS = ('_key', '_id', '_rev', 'block', 'timestamp', 'expired')
+
+# the block that is being verified and the previous verified block
+block = None
+previous = None
+# digests, numbers and changes of the verifications written for the block
+# by name; they are published without reading the verifications back
+accumulators = {}
+counts = {}
+changes = {}
+# verifications of the previous block by name and user that are not
+# written again yet and users written for the block by name
+previous_verifications = {}
+written = {}
+PREVIOUS_VERIFICATIONS = '''
+    FOR v IN verifications
+        FILTER v.name == @name
+            AND v.block <= @previous
+            AND (v.expired == null OR v.expired > @previous)
+        RETURN v
+'''
 
 
 def hash(name, user, rank=''):
     message = (name + user + str(rank)).encode('ascii')
     h = base64.b64encode(sha256(message).digest()).decode("ascii")
     return h.replace('/', '_').replace('+', '-').replace('=', '')
+
+
+def reset(new_block, new_previous, keep=(), kept_changes=None):
+    global block, previous
+    block = new_block
+    previous = new_previous
+    for d in (accumulators, counts, changes):
+        for name in list(d):
+            if name not in keep:
+                del d[name]
+    changes.update(kept_changes or {})
+    previous_verifications.clear()
+    written.clear()
+
+
+def add(name, user, h):
+    if name not in accumulators:
+        accumulators[name] = merkle.Accumulator(config.MERKLE_PREFIX_LENGTH)
+    accumulators[name].add(user, h)
+
+
+def content(verification):
+    return {k: v for k, v in verification.items() if k not in IGNORED_FIELDS}
+
+
+def load_previous(name):
+    if previous is None:
+        return {}
+    cursor = database.query(database.db('_system'), PREVIOUS_VERIFICATIONS,
+                            bind_vars={'name': name, 'previous': previous})
+    return {v['user']: v for v in cursor}
+
+
+def insert(collection, verification):
+    name = verification['name']
+    user = verification['user']
+    if name not in written:
+        written[name] = set()
+        previous_verifications[name] = load_previous(name)
+        changes.setdefault(name, {'added': 0, 'changed': 0, 'removed': 0})
+    if user in written[name]:
+        return
+    written[name].add(user)
+    counts[name] = counts.get(name, 0) + 1
+    if 'hash' in verification:
+        add(name, user, verification['hash'])
+
+    old = previous_verifications[name].pop(user, None)
+    if old is None:
+        changes[name]['added'] += 1
+    elif content(old) == content(verification):
+        return
+    else:
+        changes[name]['changed'] += 1
+        collection.update({'_key': old['_key'], 'expired': block})
+    collection.insert(verification)
+
+
+def finish(names):
+    # expires the verifications of the previous block that the verifier
+    # did not write again
+    db = database.db('_system')
+    for name in names:
+        if name not in previous_verifications:
+            continue
+        keys = [v['_key'] for v in previous_verifications.pop(name).values()]
+        for i in range(0, len(keys), 1000):
+            db.aql.execute('''
+                FOR k IN @keys
+                    UPDATE { _key: k, expired: @block } IN verifications
+            ''', bind_vars={'keys': keys[i:i + 1000], 'block': block})
+        changes[name]['removed'] += len(keys)
@@ -1,15 +1,16 @@
 import time
-from arango import ArangoClient
 import anti_sybil.algorithms as algorithms
 from anti_sybil.utils import *
 from . import utils
 import config
+import database
+import snapshots
 
 
 def verify(block):
     print('YEKTA')
-    db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
-    json_graph = from_db(config.ARANGO_SERVER, 'snapshot')
+    db = database.db('_system')
+    json_graph = from_db(config.ARANGO_SERVER, snapshots.active)
     graph = from_json(json_graph)
     ranker = algorithms.Yekta(graph, {})
     ranker.rank()
@@ -17,7 +18,7 @@ def verify(block):
 
     for node in ranker.graph:
         counter[node.rank] += 1
-        db['verifications'].insert({
+        utils.insert(db['verifications'], {
             'name': 'Yekta',
             'user': node.name,
             'rank': node.rank,
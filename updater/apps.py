@@ -1,15 +1,20 @@
+import os
+import json
 import time
 import base64
+import hashlib
 import requests
 import traceback
 from web3 import Web3
-from arango import ArangoClient
+from concurrent.futures import ThreadPoolExecutor
 from web3.middleware import geth_poa_middleware
 from marshmallow import Schema, fields, pre_load, post_load
 import tools
 import config
+import database
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
+db = database.db('_system')
+session = requests.Session()
 w3_mainnet = Web3(Web3.WebsocketProvider(
     config.MAINNET_WSS, websocket_kwargs={'timeout': 60}))
 sp_contract_mainnet = w3_mainnet.eth.contract(
@@ -96,18 +101,73 @@ def str2bytes32(s):
     return (bytes(s, 'utf-8')).hex() + padding
 
 
+# etag and last modified headers of apps.json and its parsed content
+apps_json = {}
+# etag, last modified and content hash of the logos by url
+logos = None
+
+
+def fetch(url, cached):
+    # returns None if the content is not modified since the cached response
+    headers = {}
+    if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached.get('lastModified'):
+        headers['If-Modified-Since'] = cached['lastModified']
+    res = session.get(url, headers=headers, timeout=60)
+    if res.status_code == 304:
+        return None
+    res.raise_for_status()
+    cached['etag'] = res.headers.get('ETag')
+    cached['lastModified'] = res.headers.get('Last-Modified')
+    return res.content
+
+
+def load_logos():
+    try:
+        with open(os.path.join(config.LOGOS_DIR, 'index.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_logos():
+    path = os.path.join(config.LOGOS_DIR, 'index.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(logos, f)
+    os.replace(path + '.tmp', path)
+
+
 def get_logo(app_key, url):
+    if not url:
+        return ''
+    cached = logos.setdefault(url, {})
+    path = os.path.join(config.LOGOS_DIR, cached.get('hash', ''))
+    if not os.path.isfile(path):
+        cached.clear()
     try:
-        res = requests.get(url)
-        file_format = url.split('.')[-1]
-        if file_format == 'svg':
-            file_format == 'svg+xml'
-        logo = 'data:image/' + file_format + ';base64,' + \
-            base64.b64encode(res.content).decode('ascii')
+        content = fetch(url, cached)
+        if content is not None:
+            cached['hash'] = hashlib.sha256(content).hexdigest()
+            path = os.path.join(config.LOGOS_DIR, cached['hash'])
+            if not os.path.isfile(path):
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(content)
+                os.replace(path + '.tmp', path)
     except Exception as e:
         print(f'app: {app_key} => Error in getting logo: {e}')
-        logo = ''
-    return logo
+        # the last downloaded logo is kept if the url is not reachable
+        path = os.path.join(config.LOGOS_DIR, cached.get('hash', ''))
+        if not os.path.isfile(path):
+            return ''
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    file_format = url.split('.')[-1]
+    if file_format == 'svg':
+        file_format = 'svg+xml'
+    return 'data:image/' + file_format + ';base64,' + \
+        base64.b64encode(content).decode('ascii')
 
 
 def row_to_app(row):
@@ -119,17 +179,45 @@ def row_to_app(row):
     return app
 
 
+def get_apps_json():
+    if 'data' not in apps_json:
+        apps_json.clear()
+    content = fetch(config.APPS_JSON_FILE, apps_json)
+    if content is not None:
+        apps_json.pop('data', None)
+        apps_json['data'] = json.loads(content)
+    return apps_json['data']
+
+
+def is_changed(app, stored):
+    return stored is None or any(
+        stored.get(k) != v for k, v in app.items())
+
+
+USED_SPONSORSHIPS = '''
+    FOR s in sponsorships
+        FILTER s.expireDate == null
+        COLLECT app = s._to WITH COUNT INTO length
+        RETURN {"app": REGEX_REPLACE(app, "apps/", ""), "used": length}
+'''
+
+
 def update():
-    data = requests.get(config.APPS_JSON_FILE).json()
-
-    cursor = db.aql.execute('''
-        FOR s in sponsorships
-            FILTER s.expireDate == null
-            COLLECT app = s._to WITH COUNT INTO length
-            RETURN {"app": REGEX_REPLACE(app, "apps/", ""), "used": length}
-    ''')
+    global logos
+    if logos is None:
+        os.makedirs(config.LOGOS_DIR, exist_ok=True)
+        logos = load_logos()
+
+    data = get_apps_json()
+
+    cursor = db.aql.execute(USED_SPONSORSHIPS)
     used_sponsorships = {c['app']: c['used'] for c in cursor}
+    stored_apps = {app['_key']: app for app in db.aql.execute('''
+        FOR app in apps
+            RETURN app
+    ''')}
 
+    new_apps = []
     for row in data['Applications']:
         if ('Key' not in row) or (not row.get('Key')):
             print(f'the Key not exists => {row}')
@@ -141,42 +229,94 @@ def update():
             print(f'app: {row["Key"]} => Invalid data: {e}')
             # try to update totalSponsorships
             app = {'_key': row['Key']}
+        new_apps.append(app)
+    save_logos()
 
-        try:
-            app['totalSponsorships'] = get_sponsorships(app['_key'])
-        except Exception as e:
-            print(f'app: {row["Key"]} => Error in get totalSponsorships: {e}')
+    total_sponsorships = get_sponsorships([app['_key'] for app in new_apps])
+    changed_apps = []
+    for app in new_apps:
+        if app['_key'] in total_sponsorships:
+            app['totalSponsorships'] = total_sponsorships[app['_key']]
 
         app['usedSponsorships'] = used_sponsorships.get(app['_key'], 0)
 
+        if is_changed(app, stored_apps.get(app['_key'])):
+            changed_apps.append(app)
+
+    if changed_apps:
         db.aql.execute('''
-            INSERT @app IN apps
-            OPTIONS { overwriteMode: "update" }
+            FOR app in @apps
+                INSERT app IN apps
+                OPTIONS { overwriteMode: "update" }
         ''', bind_vars={
-            'app': app
+            'apps': changed_apps
         })
 
-    for app_key in data['Removed apps']:
+    removed_apps = [key for key in data['Removed apps'] if key in stored_apps]
+    if removed_apps:
         db.aql.execute('''
-            for app in apps
-                filter app._key == @key
-                REMOVE { _key: app._key } IN apps OPTIONS { ignoreErrors: true }
+            FOR key in @keys
+                REMOVE { _key: key } IN apps OPTIONS { ignoreErrors: true }
         ''', bind_vars={
-            'key': app_key,
+            'keys': removed_apps,
         })
+    print(f'{len(changed_apps)} apps updated and {len(removed_apps)} removed')
 
 
-def get_sponsorships(app_key):
-    app_bytes = str2bytes32(app_key)
-    mainnet_balance = sp_contract_mainnet.functions.totalContextBalance(
-        app_bytes).call()
-    idchain_balance = sp_contract_idchain.functions.totalContextBalance(
-        app_bytes).call()
-    totalSponsorships = mainnet_balance + idchain_balance
-    return totalSponsorships
+def get_balances(contract, app_keys):
+    # reads totalContextBalance of the apps in json-rpc batches; an app
+    # whose call fails is left out of the result
+    balances = {}
+    calls = []
+    for app_key in app_keys:
+        try:
+            data = contract.encodeABI(
+                fn_name='totalContextBalance', args=[str2bytes32(app_key)])
+        except Exception as e:
+            print(f'app: {app_key} => Error in get totalSponsorships: {e}')
+            continue
+        calls.append((app_key, ('eth_call', [
+            {'to': contract.address, 'data': data}, 'latest'])))
 
+    for i in range(0, len(calls), config.BALANCES_BATCH_SIZE):
+        chunk = calls[i:i + config.BALANCES_BATCH_SIZE]
+        try:
+            responses = tools.batch_request(
+                contract.web3.provider, [call for app_key, call in chunk])
+        except Exception as e:
+            # the apps are read one by one if the batch is not accepted
+            print(f'Error in batch reading balances from {contract.address}: {e}')
+            responses = [None] * len(chunk)
 
-if __name__ == '__main__':
+        for (app_key, call), response in zip(chunk, responses):
+            try:
+                if response is None:
+                    balances[app_key] = contract.functions.totalContextBalance(
+                        str2bytes32(app_key)).call()
+                elif 'error' in response:
+                    raise ValueError(response['error'])
+                else:
+                    balances[app_key] = int(response['result'], 16)
+            except Exception as e:
+                print(f'app: {app_key} => Error in get totalSponsorships: {e}')
+    return balances
+
+
+def get_sponsorships(app_keys):
+    # both chains are read concurrently and an app gets its total only
+    # if its balance is read from both of them
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        mainnet_balances, idchain_balances = executor.map(
+            lambda contract: get_balances(contract, app_keys),
+            [sp_contract_mainnet, sp_contract_idchain])
+    return {
+        app_key: mainnet_balances[app_key] + idchain_balances[app_key]
+        for app_key in app_keys
+        if app_key in mainnet_balances and app_key in idchain_balances
+    }
+
+
+def run():
     try:
         print('\nUpdating apps', time.ctime())
         ts = time.time()
@@ -196,3 +336,7 @@ if __name__ == '__main__':
     except Exception as e:
         print(f'Error in apps updater: {e}\n')
         traceback.print_exc()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,370 @@
+# Runs the updater jobs against a local stand-in for the chains and the
+# apps.json server and reports their run time, rpc calls and db writes.
+# The jobs need a running ArangoDB; use a throwaway one because --reset
+# truncates the collections that the updater reads and writes.
+#
+#   python3 bench.py --apps 50 --events-per-app 2000 --votes 200 --reset
+#   python3 bench.py --apps 10 --max-log-range 500 --rpc-latency 20 --runs 3
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VOTING_ADDRESS = '0x56741DbC203648983c359A48aaf68f25f5550B6a'
+MAINNET_SP_ADDRESS = '0x0aB346a16ceA1B1363b20430C414eAB7bC179324'
+IDCHAIN_SP_ADDRESS = '0x183C5D2d1E43A3aCC8a977023796996f8AFd2327'
+ZERO_HASH = '0x' + '00' * 32
+# a 1x1 png
+LOGO = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082')
+
+
+def hex32(n):
+    return '0x' + hex(n)[2:].rjust(64, '0')
+
+
+class Chain:
+    # the generated state of the sponsor, sponsorship and voting contracts
+
+    def __init__(self, args):
+        from web3 import Web3
+        from eth_abi import encode_abi
+        self.encode_abi = encode_abi
+        self.blocks = args.blocks
+        self.max_log_range = args.max_log_range
+        self.sponsor_topic = Web3.keccak(text='Sponsor(address)').hex()
+        self.start_vote_topic = Web3.keccak(
+            text='StartVote(uint256,address,string)').hex()
+        self.selectors = {
+            Web3.keccak(text=f)[:4].hex(): f
+            for f in ['totalContextBalance(bytes32)', 'votesLength()',
+                      'getVote(uint256)']
+        }
+
+        self.apps = []
+        self.logs = collections.defaultdict(list)
+        for i in range(args.apps):
+            key = f'bench{i}'
+            contract = '0x' + hashlib.sha256(key.encode()).hexdigest()[:40]
+            addrs = ['0x' + os.urandom(20).hex()
+                     for j in range(args.events_per_app)]
+            for addr in addrs:
+                self.logs[contract].append(
+                    (random.randint(1, self.blocks), [
+                        self.sponsor_topic, '0x' + addr[2:].rjust(64, '0')
+                    ], '0x'))
+            self.apps.append({
+                'key': key, 'contract': contract, 'addrs': addrs,
+                'balance': args.events_per_app
+            })
+
+        self.votes = []
+        for i in range(args.votes):
+            metadata = f'grant seed status | bench{i} | region | 10 | info'
+            self.votes.append({'open': i >= args.votes - args.open_votes})
+            self.logs[VOTING_ADDRESS.lower()].append((
+                random.randint(1, self.blocks),
+                [self.start_vote_topic, hex32(i), hex32(0)],
+                '0x' + encode_abi(['string'], [metadata]).hex()))
+        for logs in self.logs.values():
+            logs.sort(key=lambda log: log[0])
+
+    def block(self, number):
+        return {
+            'number': hex(number), 'hash': hex32(number),
+            'parentHash': hex32(number - 1), 'nonce': '0x' + '00' * 8,
+            'sha3Uncles': ZERO_HASH, 'logsBloom': '0x' + '00' * 256,
+            'transactionsRoot': ZERO_HASH, 'stateRoot': ZERO_HASH,
+            'receiptsRoot': ZERO_HASH, 'miner': '0x' + '00' * 20,
+            'difficulty': '0x1', 'totalDifficulty': hex(number),
+            'extraData': '0x' + '00' * 97, 'size': '0x0',
+            'gasLimit': '0x0', 'gasUsed': '0x0',
+            'timestamp': hex(int(time.time())), 'transactions': [],
+            'uncles': [], 'mixHash': ZERO_HASH
+        }
+
+    def get_logs(self, params):
+        fb = int(params.get('fromBlock', '0x0'), 16)
+        tb = params.get('toBlock', 'latest')
+        tb = self.blocks if tb == 'latest' else int(tb, 16)
+        if self.max_log_range and tb - fb + 1 > self.max_log_range:
+            raise ValueError('block range is too wide')
+        addresses = params.get('address') or list(self.logs)
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        topics = params.get('topics') or []
+        result = []
+        for address in sorted(set(a.lower() for a in addresses)):
+            for i, (number, log_topics, data) in enumerate(
+                    self.logs.get(address, [])):
+                if number < fb or number > tb:
+                    continue
+                if any(t is not None and t != log_topics[j]
+                       for j, t in enumerate(topics)):
+                    continue
+                result.append({
+                    'address': address, 'topics': log_topics, 'data': data,
+                    'blockNumber': hex(number), 'blockHash': hex32(number),
+                    'transactionHash': hex32(i), 'transactionIndex': '0x0',
+                    'logIndex': hex(i), 'removed': False
+                })
+        return result
+
+    def call(self, params):
+        to = params['to'].lower()
+        data = params['data']
+        selector = self.selectors.get(data[:10])
+        if selector == 'totalContextBalance(bytes32)':
+            key = bytes.fromhex(data[10:74]).rstrip(b'\0').decode()
+            app = next((a for a in self.apps if a['key'] == key), None)
+            balance = app['balance'] if app else 0
+            # both chains hold half of the balance
+            if to == MAINNET_SP_ADDRESS.lower():
+                balance = balance // 2
+            else:
+                balance = balance - balance // 2
+            return hex32(balance)
+        if selector == 'votesLength()':
+            return hex32(len(self.votes))
+        if selector == 'getVote(uint256)':
+            vote = self.votes[int(data[10:], 16)]
+            return '0x' + self.encode_abi(
+                ['bool', 'bool', 'uint64', 'uint64', 'uint64', 'uint64',
+                 'uint256', 'uint256', 'uint256', 'bytes'],
+                [vote['open'], False, 0, 0, 5 * 10**17, 2 * 10**17,
+                 80, 20, 100, b'']).hex()
+        raise ValueError(f'unknown call {data[:10]} to {to}')
+
+    def handle(self, method, params):
+        if method == 'eth_blockNumber':
+            return hex(self.blocks)
+        if method == 'eth_getBlockByNumber':
+            number = params[0]
+            return self.block(self.blocks if number == 'latest'
+                              else int(number, 16))
+        if method == 'eth_getLogs':
+            return self.get_logs(params[0])
+        if method == 'eth_call':
+            return self.call(params[0])
+        if method in ('eth_chainId', 'net_version'):
+            return '0x4a'
+        raise ValueError(f'unsupported method {method}')
+
+
+def handler(chain, stats, latency):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def send(self, status, body=b'', headers={}):
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def respond(self, req):
+            stats['rpc:' + req['method']] += 1
+            try:
+                result = chain.handle(req['method'], req.get('params', []))
+                return {'jsonrpc': '2.0', 'id': req['id'], 'result': result}
+            except Exception as e:
+                return {'jsonrpc': '2.0', 'id': req['id'],
+                        'error': {'code': -32000, 'message': str(e)}}
+
+        def do_POST(self):
+            req = json.loads(self.rfile.read(
+                int(self.headers['Content-Length'])))
+            stats['rpc requests'] += 1
+            if latency:
+                time.sleep(latency / 1000)
+            if isinstance(req, list):
+                resp = [self.respond(r) for r in req]
+            else:
+                resp = self.respond(req)
+            self.send(200, json.dumps(resp).encode('utf-8'),
+                      {'Content-Type': 'application/json'})
+
+        def do_GET(self):
+            if self.path == '/apps.json':
+                body = json.dumps(apps_json(chain, self.server)).encode()
+            elif self.path.startswith('/logos/'):
+                body = LOGO
+            else:
+                return self.send(404)
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                stats['http 304'] += 1
+                return self.send(304)
+            stats['http 200'] += 1
+            self.send(200, body, {'ETag': etag})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def apps_json(chain, server):
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    return {
+        'Applications': [{
+            'Key': app['key'], 'Name': app['key'], 'Context': app['key'],
+            'Sponsor Public Key': '', 'Contract Address': app['contract'],
+            'Verification': 'BrightID', 'Verifications': ['BrightID'],
+            'Testing': False, 'Ids As Hex': True, 'Using Blind Sig': False,
+            'Local Filter': False, 'Node Url': '',
+            'Verification Expiration Length': 0, 'Soulbound': False,
+            'Callback Url': '', 'POA Network': True,
+            'RPC Endpoint': url + '/', 'Sponsoring': True,
+            'Links': [f'https://{app["key"]}.example.com'],
+            'Images': [f'{url}/logos/{app["key"]}.png']
+        } for app in chain.apps],
+        'Removed apps': ['removed']
+    }
+
+
+def count_writes(stats):
+    # counts the aql queries, their modified documents and the documents
+    # written through the collection api
+    from arango.aql import AQL
+    from arango.collection import StandardCollection
+
+    execute = AQL.execute
+
+    def counted_execute(self, query, *args, **kwargs):
+        kwargs['count'] = True
+        cursor = execute(self, query, *args, **kwargs)
+        stats['aql queries'] += 1
+        stats['db writes'] += (cursor.statistics() or {}).get('modified', 0)
+        return cursor
+    AQL.execute = counted_execute
+
+    for name in ['insert', 'update', 'replace', 'delete']:
+        method = getattr(StandardCollection, name)
+
+        def counted(self, *args, _method=method, **kwargs):
+            stats['db writes'] += 1
+            return _method(self, *args, **kwargs)
+        setattr(StandardCollection, name, counted)
+
+
+def setup_db(db, chain, args):
+    collections = {'apps': False, 'sponsorships': True, 'variables': False,
+                   'testblocks': False, 'groups': False}
+    for name, edge in collections.items():
+        if not db.has_collection(name):
+            db.create_collection(name, edge=edge)
+        elif args.reset:
+            db.collection(name).truncate()
+
+    # apps start scanning their events from the first block and a part of
+    # their sponsored addresses have requested a sponsorship from the node
+    db.collection('variables').import_bulk([{
+        '_key': f'LAST_BLOCK_LOG_{app["key"]}', 'value': 0
+    } for app in chain.apps], on_duplicate='replace')
+    db.collection('sponsorships').import_bulk([{
+        '_from': 'users/0', '_to': f'apps/{app["key"]}', 'appId': addr,
+        'expireDate': int(time.time()) + 3600, 'appHasAuthorized': False,
+        'spendRequested': True
+    } for app in chain.apps for addr in app['addrs']
+        if random.random() < args.requested_ratio])
+    db.collection('groups').import_bulk([{
+        '_key': f'bench{i}', 'seed': False
+    } for i in range(len(chain.votes))], on_duplicate='replace')
+    db.collection('variables').import_bulk([{
+        '_key': 'SEED_GROUP_UPDATER_CHECKED_VOTES', 'next': 0, 'votes': []
+    }], on_duplicate='replace')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the updater jobs against a local chain')
+    parser.add_argument('--apps', type=int, default=20)
+    parser.add_argument('--events-per-app', type=int, default=500)
+    parser.add_argument('--requested-ratio', type=float, default=0.5,
+                        help='ratio of sponsored addresses with a request')
+    parser.add_argument('--votes', type=int, default=100)
+    parser.add_argument('--open-votes', type=int, default=5)
+    parser.add_argument('--blocks', type=int, default=100000)
+    parser.add_argument('--max-log-range', type=int, default=0,
+                        help='reject eth_getLogs ranges wider than this')
+    parser.add_argument('--rpc-latency', type=float, default=0,
+                        help='milliseconds each rpc request waits')
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--arango-host', default='localhost')
+    parser.add_argument('--arango-port', type=int, default=8529)
+    parser.add_argument('--reset', action='store_true',
+                        help='truncate the updater collections first')
+    args = parser.parse_args()
+
+    chain = Chain(args)
+    stats = collections.Counter()
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', 0), handler(chain, stats, args.rpc_latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/'
+
+    # the jobs read their settings from the environment when imported
+    os.environ.update({
+        'BN_UPDATER_SEED_VOTING_ADDRESS': VOTING_ADDRESS,
+        'BN_UPDATER_SP_ADDRESS_MAINNET': MAINNET_SP_ADDRESS,
+        'BN_UPDATER_SP_ADDRESS_IDCHAIN': IDCHAIN_SP_ADDRESS,
+        'BN_UPDATER_MAINNET_WSS': 'ws://127.0.0.1:1/',
+        'BN_UPDATER_IDCHAIN_WSS': 'ws://127.0.0.1:1/',
+        'BN_UPDATER_SEED_GROUPS_WS_URL': 'ws://127.0.0.1:1/',
+        'BN_UPDATER_LOGOS_DIR': tempfile.mkdtemp(),
+        'BN_ARANGO_PROTOCOL': 'http',
+        'BN_ARANGO_HOST': args.arango_host,
+        'BN_ARANGO_PORT': str(args.arango_port),
+    })
+    sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+    from web3 import Web3
+    from web3.middleware import geth_poa_middleware
+    import config
+    import apps
+    import seed_groups
+    import sponsorships
+    config.APPS_JSON_FILE = url + 'apps.json'
+    config.IDCHAIN_RPC_URL = url
+
+    # the websocket clients of the jobs are replaced by http ones
+    w3 = Web3(Web3.HTTPProvider(url))
+    w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    apps.sp_contract_mainnet = w3.eth.contract(
+        address=config.MAINNET_SP_ADDRESS, abi=config.SP_ABI)
+    apps.sp_contract_idchain = w3.eth.contract(
+        address=config.IDCHAIN_SP_ADDRESS, abi=config.SP_ABI)
+    seed_groups.w3 = w3
+    seed_groups.voting = w3.eth.contract(
+        address=config.VOTING_ADDRESS, abi=config.VOTING_ABI)
+
+    setup_db(apps.db, chain, args)
+    count_writes(stats)
+
+    results = []
+    for run in range(1, args.runs + 1):
+        for name, job in [('apps', apps.run), ('seed_groups', seed_groups.run),
+                          ('sponsorships', sponsorships.run)]:
+            stats.clear()
+            ts = time.time()
+            job()
+            results.append((run, name, time.time() - ts, dict(stats)))
+
+    print()
+    for run, name, duration, job_stats in results:
+        print(f'run {run} {name}: {duration:.2f} seconds')
+        for k, v in sorted(job_stats.items()):
+            print(f'    {k}: {v}')
+
+
+if __name__ == '__main__':
+    main()
@@ -16,14 +16,53 @@ MAINNET_WSS = os.environ['BN_UPDATER_MAINNET_WSS']
 IDCHAIN_WSS = os.environ['BN_UPDATER_IDCHAIN_WSS']
 SEED_GROUPS_WS_URL = os.environ['BN_UPDATER_SEED_GROUPS_WS_URL']
 
+# initial number of blocks in each Sponsor logs request; it is adapted per
+# app between 1 and MAX_CHUNK based on provider errors and result sizes
 CHUNK = 1000
+MAX_CHUNK = 100000
 RECHECK_CHUNK = 10
+# parts of the error messages of providers that reject a logs request
+# because its range is too large or it has too many results
+RANGE_ERRORS = ['block range', 'more than', 'too many', 'too large',
+                'response size', 'query timeout']
+# accepted requests at the largest accepted range before it is doubled
+RANGE_LIMIT_GROWTH = 10
+# a request returning more logs than this halves the next range
+LOGS_PER_REQUEST = 1000
+# number of ranges requested concurrently for an app that is behind
+SCAN_CONCURRENCY = 4
+# seconds an app may keep scanning in one run before it is processed
+SCAN_TIME_LIMIT = 45
 
 APPS_JSON_FILE = 'https://apps.brightid.org/apps.json'
+# downloaded app logos are kept by their content hash in this directory
+LOGOS_DIR = os.environ.get('BN_UPDATER_LOGOS_DIR', '/tmp/logos')
 
 BN_ARANGO_PROTOCOL = os.environ['BN_ARANGO_PROTOCOL']
 BN_ARANGO_HOST = os.environ['BN_ARANGO_HOST']
 BN_ARANGO_PORT = int(os.environ['BN_ARANGO_PORT'])
 ARANGO_SERVER = f'{BN_ARANGO_PROTOCOL}://{BN_ARANGO_HOST}:{BN_ARANGO_PORT}'
 
+# seconds to wait for a response of ArangoDB; the jobs only run short
+# queries, so a request that hangs is given up and retried in the next run
+ARANGO_READ_TIMEOUT = float(os.environ.get('BN_ARANGO_READ_TIMEOUT', 120))
+# persistent indexes as (collection, fields) that the queries of the jobs
+# rely on; they are created at startup if they do not exist
+INDEXES = [
+    ('sponsorships', ['_to', 'appId']),
+    ('sponsorships', ['expireDate']),
+    ('testblocks', ['contextId']),
+]
+
 IDCHAIN_RPC_URL = 'https://idchain.one/rpc/'
+# number of balance calls sent in each json-rpc batch
+BALANCES_BATCH_SIZE = 100
+
+# seconds between runs of each updater job
+SPONSORSHIPS_INTERVAL = 60
+APPS_INTERVAL = 300
+SEED_GROUPS_INTERVAL = 300
+# number of concurrent requests to each app's rpc endpoint; websocket
+# providers do not support concurrent requests on one connection
+HTTP_ENDPOINT_CONCURRENCY = 4
+WS_ENDPOINT_CONCURRENCY = 1
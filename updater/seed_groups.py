@@ -1,23 +1,20 @@
 import time
 import traceback
 from web3 import Web3
-from arango import ArangoClient
+from eth_abi import decode_abi
 from web3.middleware import geth_poa_middleware
 import tools
 import config
+import database
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
+db = database.db('_system')
 w3 = Web3(Web3.WebsocketProvider(config.SEED_GROUPS_WS_URL))
 if config.SEED_GROUPS_WS_URL.count('rinkeby') > 0 or config.SEED_GROUPS_WS_URL.count('idchain') > 0:
     w3.middleware_onion.inject(geth_poa_middleware, layer=0)
 voting = w3.eth.contract(address=config.VOTING_ADDRESS, abi=config.VOTING_ABI)
 
 
-def get_action(vote_id):
-    text = voting.events.StartVote.createFilter(
-        fromBlock="0x0",
-        argument_filters={'voteId': vote_id}
-    ).get_all_entries()[0].args.metadata
+def get_action(text):
     sections = [s.strip() for s in text.split('|')]
     if len(sections) < 3:
         print(f'"{text}" is an invalid action')
@@ -60,43 +57,133 @@ def execute(action):
         groups_coll.update({'_key': action['group'], 'seed': False})
 
 
+def get_checked(variables, votes_length):
+    # votes before "next" are all checked and "votes" has the checked ones
+    # after it; the first version of the variable only had the "votes" list
+    if variables.has('SEED_GROUP_UPDATER_CHECKED_VOTES'):
+        doc = variables.get('SEED_GROUP_UPDATER_CHECKED_VOTES')
+        return doc.get('next', 0), set(doc['votes'])
+    variables.insert({
+        '_key': 'SEED_GROUP_UPDATER_CHECKED_VOTES',
+        'next': votes_length,
+        'votes': []
+    })
+    return votes_length, set()
+
+
+def update_start_votes(variables, from_block, to_block, next_vote):
+    # metadata of StartVote events by vote id is kept for the unchecked
+    # votes and updated from the last scanned block
+    if variables.has('SEED_GROUP_UPDATER_START_VOTES'):
+        index = variables.get('SEED_GROUP_UPDATER_START_VOTES')
+        from_block = index['lastBlock'] + 1
+    else:
+        index = {'_key': 'SEED_GROUP_UPDATER_START_VOTES', 'metadata': {}}
+    if from_block <= to_block:
+        events = voting.events.StartVote.getLogs(
+            fromBlock=from_block, toBlock=to_block)
+        for e in events:
+            if e.args.voteId >= next_vote:
+                index['metadata'][str(e.args.voteId)] = e.args.metadata
+    index['lastBlock'] = max(to_block, from_block - 1)
+    return index
+
+
+def get_votes(vote_ids):
+    # all votes are read in one json-rpc batch
+    responses = tools.batch_request(w3.provider, [('eth_call', [{
+        'to': voting.address,
+        'data': voting.encodeABI(fn_name='getVote', args=[vote_id])
+    }, 'latest']) for vote_id in vote_ids])
+    abi = next(f for f in voting.abi if f.get('name') == 'getVote')
+    types = [o['type'] for o in abi['outputs']]
+    votes = {}
+    for vote_id, response in zip(vote_ids, responses):
+        if 'error' in response:
+            print(f'Error in getting vote {vote_id}: {response["error"]}')
+            continue
+        # a wrong address or a node that is not synced returns 0x or a
+        # truncated result instead of an error
+        try:
+            votes[vote_id] = decode_abi(
+                types, bytes.fromhex(response['result'][2:]))
+        except Exception as e:
+            print(f'Error in decoding vote {vote_id}: {e}')
+    return votes
+
+
+def start_block(variables, votes, bn):
+    # a new index starts from the block of the first unchecked vote's
+    # StartVote event, that is the block after its snapshot block, so the
+    # migrated and new indexes do not scan the chain from block 0
+    if variables.has('SEED_GROUP_UPDATER_START_VOTES'):
+        return None
+    return min((vote['snapshotBlock'] + 1 for vote in votes.values()),
+               default=bn + 1)
+
+
 def update():
     print('Updating Seed Groups', time.ctime())
+    bn = w3.eth.blockNumber
     votes_length = voting.functions.votesLength().call()
     variables = db.collection('variables')
-    if variables.has('SEED_GROUP_UPDATER_CHECKED_VOTES'):
-        checked = variables.get('SEED_GROUP_UPDATER_CHECKED_VOTES')['votes']
-    else:
-        checked = list(range(0, votes_length))
-        variables.insert({
-            '_key': 'SEED_GROUP_UPDATER_CHECKED_VOTES',
-            'votes': checked
-        })
+    next_vote, checked = get_checked(variables, votes_length)
     keys = ['open', 'executed', 'startDate', 'snapshotBlock', 'supportRequired',
             'minAcceptQuorum', 'yea', 'nay', 'votingPower', 'script']
-    vote_ids = [v for v in range(0, votes_length) if v not in checked]
+    vote_ids = [v for v in range(next_vote, votes_length) if v not in checked]
+    votes = get_votes(vote_ids) if vote_ids else {}
+    votes = {vote_id: dict(zip(keys, vote)) for vote_id, vote in votes.items()}
+    from_block = start_block(variables, votes, bn)
+    if from_block is not None and len(votes) < len(vote_ids):
+        print('Not all unchecked votes are read to start the StartVote index')
+        return
+    index = update_start_votes(variables, from_block, bn, next_vote)
     for vote_id in vote_ids:
+        if vote_id not in votes:
+            continue
         print(f'processing vote: {vote_id}')
-        vote = voting.functions.getVote(vote_id).call()
-        vote = dict(zip(keys, vote))
+        vote = votes[vote_id]
         supported = vote['yea'] / (vote['yea'] + vote['nay']
                                    ) >= vote['supportRequired'] / 10**18
         approved = (vote['yea'] / vote['votingPower']
                     ) >= vote['minAcceptQuorum'] / 10**18
         if not vote['open']:
             if supported and approved:
-                action = get_action(vote_id)
+                metadata = index['metadata'].get(str(vote_id))
+                if metadata is None:
+                    print(f'StartVote event of vote {vote_id} is not found')
+                    continue
+                action = get_action(metadata)
                 print(f"action: {action}")
                 if action:
                     execute(action)
-            checked.append(vote_id)
+            checked.add(vote_id)
+
+    while next_vote in checked:
+        checked.remove(next_vote)
+        next_vote += 1
+    index['metadata'] = {k: v for k, v in index['metadata'].items()
+                         if int(k) >= next_vote and int(k) not in checked}
+    db.aql.execute('''
+        upsert { _key: "SEED_GROUP_UPDATER_START_VOTES" }
+        insert @index
+        replace @index
+        in variables
+    ''', bind_vars={
+        'index': {
+            '_key': 'SEED_GROUP_UPDATER_START_VOTES',
+            'lastBlock': index['lastBlock'],
+            'metadata': index['metadata']
+        }
+    })
     variables.update({
         '_key': 'SEED_GROUP_UPDATER_CHECKED_VOTES',
-        'votes': checked
+        'next': next_vote,
+        'votes': sorted(checked)
     })
 
 
-if __name__ == '__main__':
+def run():
     try:
         update()
 
@@ -113,3 +200,7 @@ if __name__ == '__main__':
     except Exception as e:
         print(f'Error in updater: {e}')
         traceback.print_exc()
+
+
+if __name__ == '__main__':
+    run()
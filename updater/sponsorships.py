@@ -1,36 +1,148 @@
 import time
+import threading
 import traceback
 from web3 import Web3
-from arango import ArangoClient
 from concurrent.futures import ThreadPoolExecutor
 from web3.middleware import geth_poa_middleware, local_filter_middleware
 import tools
 import config
+import database
 
-db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
+db = database.db('_system')
+
+# one provider per rpc endpoint is shared by all apps that use it and
+# w3 instances are shared by apps with the same endpoint and middlewares;
+# every request to an endpoint holds its semaphore, which is kept for the
+# life of the process so a recreated provider is limited together with
+# the requests still using the old one
+providers = {}
+endpoint_locks = {}
+w3s = {}
+lock = threading.Lock()
+# number of blocks in each Sponsor logs request by app key, the largest
+# range that is known to be accepted by the app's provider and the number
+# of accepted requests of that size since it was set
+ranges = {}
+limits = {}
+successes = {}
+
+
+def w3_key(app):
+    return (app['rpcEndpoint'], bool(app.get('poaNetwork')),
+            bool(app.get('localFilter')))
+
+
+def get_provider(endpoint):
+    if endpoint not in providers:
+        if endpoint.startswith('http'):
+            providers[endpoint] = Web3.HTTPProvider(
+                endpoint, request_kwargs={'timeout': 60})
+            concurrency = config.HTTP_ENDPOINT_CONCURRENCY
+        elif endpoint.startswith('ws'):
+            providers[endpoint] = Web3.WebsocketProvider(
+                endpoint, websocket_kwargs={'timeout': 60})
+            concurrency = config.WS_ENDPOINT_CONCURRENCY
+        else:
+            raise ValueError(f'invalid RPC: {endpoint}')
+        if endpoint not in endpoint_locks:
+            endpoint_locks[endpoint] = threading.Semaphore(concurrency)
+    return providers[endpoint]
 
 
 def get_w3(app):
-    if app['rpcEndpoint'].startswith('http'):
-        w3 = Web3(Web3.HTTPProvider(
-            app['rpcEndpoint'], request_kwargs={'timeout': 60}))
-    elif app['rpcEndpoint'].startswith('ws'):
-        w3 = Web3(Web3.WebsocketProvider(
-            app['rpcEndpoint'], websocket_kwargs={'timeout': 60}))
-    else:
-        raise ValueError(f'invalid RPC: {app["rpcEndpoint"]}')
+    key = w3_key(app)
+    with lock:
+        if key in w3s:
+            return w3s[key]
+        w3 = Web3(get_provider(app['rpcEndpoint']))
+        if app.get('poaNetwork'):
+            w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+
+        if app.get('localFilter'):
+            w3.middleware_onion.add(local_filter_middleware)
+        w3s[key] = w3
+        return w3
+
+
+def forget_w3(app):
+    # a broken connection is recreated in the next run
+    endpoint = app['rpcEndpoint']
+    with lock:
+        for key in [key for key in w3s if key[0] == endpoint]:
+            del w3s[key]
+        providers.pop(endpoint, None)
+
+
+def call(app, f, *args, **kwargs):
+    with endpoint_locks[app['rpcEndpoint']]:
+        return f(*args, **kwargs)
+
+
+def get_logs(app, contract, fb, tb):
+    return call(app, contract.events.Sponsor.getLogs, fromBlock=fb, toBlock=tb)
 
-    if app.get('poaNetwork'):
-        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
 
-    if app.get('localFilter'):
-        w3.middleware_onion.add(local_filter_middleware)
-    return w3
+def is_range_error(e):
+    # providers reject ranges that span too many blocks or have too many
+    # logs; other errors like timeouts or outages are not solved by splitting
+    error = e.args[0] if e.args else e
+    if isinstance(error, dict):
+        error = error.get('message', '')
+    message = str(error).lower()
+    return any(m in message for m in config.RANGE_ERRORS)
+
+
+def set_range(app, size):
+    with lock:
+        limit = limits.get(app['_key'], config.MAX_CHUNK)
+        ranges[app['_key']] = max(1, min(limit, size))
+
+
+def reject_range(app, size):
+    with lock:
+        limits[app['_key']] = max(1, size // 2)
+        successes[app['_key']] = 0
+        ranges[app['_key']] = limits[app['_key']]
+
+
+def accept_range(app, size):
+    # the limit grows back after enough requests of its size are accepted
+    key = app['_key']
+    with lock:
+        limit = limits.get(key, config.MAX_CHUNK)
+        if size < limit or limit >= config.MAX_CHUNK:
+            return
+        successes[key] = successes.get(key, 0) + 1
+        if successes[key] >= config.RANGE_LIMIT_GROWTH:
+            limits[key] = min(config.MAX_CHUNK, limit * 2)
+            successes[key] = 0
+
+
+def scan(app, contract, fb, tb):
+    size = tb - fb + 1
+    try:
+        events = get_logs(app, contract, fb, tb)
+    except Exception as e:
+        if size == 1 or not is_range_error(e):
+            raise
+        print(f'app: {app["_key"]} => error in getting logs from: {fb} '
+              f'to: {tb}, splitting the range: {e}')
+        reject_range(app, size)
+        mb = fb + size // 2 - 1
+        return scan(app, contract, fb, mb) + scan(app, contract, mb + 1, tb)
+
+    if len(events) > config.LOGS_PER_REQUEST:
+        set_range(app, size // 2)
+    elif (size >= ranges.get(app['_key'], config.CHUNK)
+          and len(events) < config.LOGS_PER_REQUEST // 2):
+        accept_range(app, size)
+        set_range(app, size * 2)
+    return events
 
 
 def check_events(app):
     w3 = get_w3(app)
-    cb = w3.eth.getBlock('latest').number
+    cb = call(app, w3.eth.getBlock, 'latest').number
 
     c = db.aql.execute('''
         for v in variables
@@ -49,69 +161,118 @@ def check_events(app):
     else:
         fb = c.next()
     fb -= config.RECHECK_CHUNK
-    tb = min(cb, fb + config.CHUNK)
-    if tb < fb:
-        fb = tb - config.CHUNK
+    if fb > cb:
+        fb = cb - config.CHUNK
+    fb = max(0, fb)
 
-    print(f'app: {app["_key"]} => checking events from: {fb} to: {tb}')
+    print(f'app: {app["_key"]} => checking events from: {fb} to: {cb}')
     sponsor_event_contract = w3.eth.contract(
         address=w3.toChecksumAddress(app['sponsorEventContract']),
         abi=config.SPONSOR_EVENT_CONTRACT_ABI)
-    time.sleep(3)
-    events = sponsor_event_contract.events.Sponsor.createFilter(
-        fromBlock=fb, toBlock=tb, argument_filters=None
-    ).get_all_entries()
-    sponsored_addrs = [e['args']['addr'].lower() for e in events]
-    return sponsored_addrs, tb
-
 
-def sponsor(app_key, app_id):
-    c = db['sponsorships'].find({
-        '_to': 'apps/' + app_key,
-        'appId': app_id
-    })
-
-    if c.empty():
-        db['sponsorships'].insert({
-            '_from': 'users/0',
-            '_to': 'apps/' + app_key,
-            'expireDate': int(time.time()) + 3600,
-            'appId': app_id,
-            'appHasAuthorized': True,
-            'spendRequested': False
-        })
-        print(
-            f'app: {app_key} appId: {app_id} => app authorization applied successfully')
-        return False
-
-    sponsorship = c.next()
-    if sponsorship['appHasAuthorized']:
-        print(f'app: {app_key} appId: {app_id} => app has authorized before')
-        return False
-
-    if sponsorship['spendRequested']:
-        db['sponsorships'].update({
-            '_key': sponsorship['_key'],
-            'expireDate': None,
-            'appHasAuthorized': True,
-            'timestamp': int(time.time() * 1000),
-        })
-        print(f'app: {app_key} appId: {app_id} => sponsored successfully')
-        return True
+    # consecutive ranges are requested concurrently and the scan stops at
+    # the first range that fails so the next run continues from there
+    sponsored_addrs = []
+    tb = None
+    deadline = time.time() + config.SCAN_TIME_LIMIT
+    with ThreadPoolExecutor(max_workers=config.SCAN_CONCURRENCY) as executor:
+        while fb <= cb and time.time() < deadline:
+            size = ranges.get(app['_key'], config.CHUNK)
+            windows = []
+            while fb <= cb and len(windows) < config.SCAN_CONCURRENCY:
+                windows.append((fb, min(cb, fb + size - 1)))
+                fb = windows[-1][1] + 1
+            futures = [executor.submit(scan, app, sponsor_event_contract, *w)
+                       for w in windows]
+            for window, future in zip(windows, futures):
+                try:
+                    events = future.result()
+                except Exception as e:
+                    if tb is None:
+                        raise
+                    print(f'app: {app["_key"]} => error in getting logs from: '
+                          f'{window[0]} to: {window[1]}: {e}')
+                    return sponsored_addrs, tb
+                sponsored_addrs.extend(
+                    e['args']['addr'].lower() for e in events)
+                tb = window[1]
+    print(f'app: {app["_key"]} => checked events to: {tb}')
+    return sponsored_addrs, tb
 
 
-def remove_testblocks(app_key, context_id):
-    # remove testblocks if exists
-    db.aql.execute('''
+SPONSOR = '''
+    let existing = (
+        for addr in @addrs
+            let s = first(
+                for sp in sponsorships
+                    filter sp._to == @to and sp.appId == addr
+                    return sp
+            )
+            return {
+                addr: addr,
+                insert: s == null,
+                authorized: s != null and s.appHasAuthorized,
+                spend: s != null and !s.appHasAuthorized and s.spendRequested
+            }
+    )
+    let spenders = (
+        for i in 0..length(existing) - 1
+            filter existing[i].spend
+            return i
+    )
+    let processed = @available < 1 ? [] : (
+        length(spenders) < @available ? existing :
+        slice(existing, 0, spenders[@available - 1] + 1)
+    )
+    let removed = (
         for t in testblocks
-            filter t.contextId == @context_id
-            and t.app == @app_key
+            filter @removeTestblocks
+            and t.contextId in @addrs
+            and t.app == @key
             and t.action == "sponsorship"
             remove { _key: t._key } in testblocks options { ignoreErrors: true }
-    ''', bind_vars={
-        'context_id': context_id,
-        'app_key': app_key,
-    })
+    )
+    let written = (
+        for e in processed
+            filter e.insert or e.spend
+            upsert { _to: @to, appId: e.addr }
+            insert {
+                _from: "users/0",
+                _to: @to,
+                expireDate: @expireDate,
+                appId: e.addr,
+                appHasAuthorized: true,
+                spendRequested: false
+            }
+            update {
+                expireDate: null,
+                appHasAuthorized: true,
+                timestamp: @timestamp
+            }
+            in sponsorships
+    )
+    let used = length(processed[* filter CURRENT.spend])
+    let updated = (
+        for app in apps
+            filter app._key == @key and used > 0
+            update app with { usedSponsorships: app.usedSponsorships + used } in apps
+    )
+    return { processed: processed, used: used }
+'''
+
+
+def sponsor(app, sponsored_addrs):
+    # applies all sponsored addresses of an app in one query; addresses are
+    # processed in order until the app runs out of unused sponsorships
+    return db.aql.execute(SPONSOR, bind_vars={
+        'addrs': sponsored_addrs,
+        'key': app['_key'],
+        'to': 'apps/' + app['_key'],
+        'available': app['totalSponsorships'] - app['usedSponsorships'],
+        'removeTestblocks': not app.get('usingBlindSig'),
+        'expireDate': int(time.time()) + 3600,
+        'timestamp': int(time.time() * 1000),
+    }).next()
 
 
 def update_app(app):
@@ -123,31 +284,28 @@ def update_app(app):
         })
     except Exception as e:
         print(f'app: {app["_key"]} => Error in getting events: {e}')
+        forget_w3(app)
         return
 
-    used = 0
-    for sponsored_addr in sponsored_addrs:
-        if not app.get('usingBlindSig'):
-            remove_testblocks(app['_key'], sponsored_addr)
+    # an address may be sponsored more than once in the scanned range
+    sponsored_addrs = list(dict.fromkeys(sponsored_addrs))
+    if not sponsored_addrs:
+        return
 
-        if app['totalSponsorships'] - (app['usedSponsorships'] + used) < 1:
+    result = sponsor(app, sponsored_addrs)
+    for e in result['processed']:
+        if e['spend']:
             print(
-                f'app: {app["_key"]} appId: {sponsored_addr} => app does not have unused sponsorships')
-            continue
-
-        sponsored = sponsor(app['_key'], sponsored_addr)
-        if sponsored:
-            used += 1
-
-    if used > 0:
-        db.aql.execute('''
-            for app in apps
-              filter app._key == @key
-              update app with { usedSponsorships: app.usedSponsorships + @used } in apps
-        ''', bind_vars={
-            'key': app['_key'],
-            'used': used
-        })
+                f'app: {app["_key"]} appId: {e["addr"]} => sponsored successfully')
+        elif e['insert']:
+            print(
+                f'app: {app["_key"]} appId: {e["addr"]} => app authorization applied successfully')
+        elif e['authorized']:
+            print(
+                f'app: {app["_key"]} appId: {e["addr"]} => app has authorized before')
+    for addr in sponsored_addrs[len(result['processed']):]:
+        print(
+            f'app: {app["_key"]} appId: {addr} => app does not have unused sponsorships')
 
 
 def update():
@@ -171,7 +329,7 @@ def update():
         executor.map(update_app, apps)
 
 
-if __name__ == '__main__':
+def run():
     try:
         print(f'\nUpdating sponsors {time.ctime()}')
         ts = time.time()
@@ -191,3 +349,7 @@ if __name__ == '__main__':
     except Exception as e:
         print(f'Error in sponsorships updater: {e}\n')
         traceback.print_exc()
+
+
+if __name__ == '__main__':
+    run()
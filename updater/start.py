@@ -1,14 +1,16 @@
 import time
 import socket
-from arango import ArangoClient
+import threading
+import traceback
 import apps
 import seed_groups
 import sponsorships
 import config
+import database
 
 
 def wait():
-    db = ArangoClient(hosts=config.ARANGO_SERVER).db('_system')
+    db = database.db('_system')
     while True:
         time.sleep(5)
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -31,8 +33,32 @@ def wait():
         return
 
 
+def schedule(job, interval):
+    # runs the job every interval seconds; a run that takes longer than the
+    # interval is followed immediately by the next one
+    while True:
+        ts = time.time()
+        try:
+            job()
+        except Exception as e:
+            print(f'Error in running {job.__module__}: {e}')
+            traceback.print_exc()
+        time.sleep(max(0, interval - (time.time() - ts)))
+
+
 if __name__ == '__main__':
     wait()
-    apps.update()
-    seed_groups.update()
-    sponsorships.update()
+    database.ensure_indexes('_system', config.INDEXES)
+    apps.run()
+    seed_groups.run()
+    sponsorships.run()
+    jobs = [
+        (sponsorships.run, config.SPONSORSHIPS_INTERVAL),
+        (apps.run, config.APPS_INTERVAL),
+        (seed_groups.run, config.SEED_GROUPS_INTERVAL),
+    ]
+    threads = [threading.Thread(target=schedule, args=job) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,35 @@
+import os
+os.environ.setdefault('BN_UPDATER_MAINNET_WSS', '')
+os.environ.setdefault('BN_UPDATER_IDCHAIN_WSS', 'wss://idchain.one/ws/')
+os.environ.setdefault('BN_UPDATER_SEED_VOTING_ADDRESS',
+                      '0x56741DbC203648983c359A48aaf68f25f5550B6a')
+os.environ.setdefault('BN_UPDATER_SP_ADDRESS_MAINNET',
+                      '0x0aB346a16ceA1B1363b20430C414eAB7bC179324')
+os.environ.setdefault('BN_UPDATER_SP_ADDRESS_IDCHAIN',
+                      '0x183C5D2d1E43A3aCC8a977023796996f8AFd2327')
+os.environ.setdefault('BN_UPDATER_SEED_GROUPS_WS_URL', 'wss://idchain.one/ws/')
+os.environ.setdefault('BN_ARANGO_PROTOCOL', 'http')
+os.environ.setdefault('BN_ARANGO_HOST', 'localhost')
+os.environ.setdefault('BN_ARANGO_PORT', '8529')
+
+import unittest
+import config
+import dbtest
+import apps
+import sponsorships
+
+
+class TestIndexes(dbtest.IndexTests, unittest.TestCase):
+    collections = {'sponsorships': True, 'testblocks': False, 'apps': False}
+    indexes = config.INDEXES
+    queries = [
+        (sponsorships.SPONSOR, {
+            'addrs': ['0x0'], 'key': 'app', 'to': 'apps/app', 'available': 1,
+            'removeTestblocks': True, 'expireDate': 1, 'timestamp': 1
+        }),
+        (apps.USED_SPONSORSHIPS, {}),
+    ]
+
+
+if __name__ == '__main__':
+    unittest.main()
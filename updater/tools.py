@@ -1,5 +1,7 @@
-import requests
 import json
+import asyncio
+import requests
+from web3 import Web3
 import config
 
 
@@ -10,3 +12,28 @@ def get_idchain_block_number():
     r = requests.request('POST', config.IDCHAIN_RPC_URL,
                          data=payload, headers=headers)
     return int(r.json()['result'], 0)
+
+
+def batch_request(provider, calls):
+    # sends (method, params) calls as one json-rpc batch and returns the
+    # responses in the order of the calls
+    payload = json.dumps([{
+        'jsonrpc': '2.0', 'method': method, 'params': params, 'id': i
+    } for i, (method, params) in enumerate(calls)])
+    if isinstance(provider, Web3.HTTPProvider):
+        r = requests.post(provider.endpoint_uri, data=payload,
+                          **provider.get_request_kwargs())
+        r.raise_for_status()
+        responses = r.json()
+    elif isinstance(provider, Web3.WebsocketProvider):
+        future = asyncio.run_coroutine_threadsafe(
+            provider.coro_make_request(payload.encode('utf-8')),
+            Web3.WebsocketProvider._loop)
+        responses = future.result()
+    else:
+        raise ValueError(f'batch requests are not supported by {provider}')
+    if not isinstance(responses, list):
+        raise ValueError(responses.get('error', responses))
+    responses = {r['id']: r for r in responses}
+    return [responses.get(i, {'error': 'no response'})
+            for i in range(len(calls))]
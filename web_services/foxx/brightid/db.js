@@ -456,17 +456,28 @@ function userVerifications(userId) {
     const block = Math.max(
       ...Object.keys(hashes).map((block) => parseInt(block))
     );
-    verifications = verificationsColl
-      .byExample({ user: userId, block })
-      .toArray();
+    // a verification is valid from its block until its expired block and
+    // keeps the timestamp of the block it was first written in
+    verifications = query`
+      FOR v IN ${verificationsColl}
+        FILTER v.user == ${userId}
+          AND v.block <= ${block}
+          AND (v.expired == null OR v.expired > ${block})
+        RETURN MERGE(v, { block: ${block} })
+    `.toArray();
   } else {
-    verifications = verificationsColl.byExample({ user: userId }).toArray();
+    verifications = query`
+      FOR v IN ${verificationsColl}
+        FILTER v.user == ${userId} AND v.expired == null
+        RETURN v
+    `.toArray();
   }
   verifications.forEach((v) => {
     delete v._key;
     delete v._id;
     delete v._rev;
     delete v.user;
+    delete v.expired;
   });
   return verifications.filter((v) => !v.expression);
 }
@@ -779,9 +790,10 @@ function getState() {
       COLLECT WITH COUNT INTO length
       RETURN length
   `.toArray()[0];
-  const verificationsHashes = JSON.parse(
-    variablesColl.document("VERIFICATIONS_HASHES").hashes
-  );
+  const hashesDoc = variablesColl.document("VERIFICATIONS_HASHES");
+  const verificationsHashes = JSON.parse(hashesDoc.hashes);
+  // documents written before the format was added hold format 1 hashes
+  const verificationsHashesFormat = hashesDoc.format || 1;
   const conf = module.context.configuration;
   const consensusSenderAddress = getConsensusSenderAddress();
   const { privateKey: ethPrivateKey } = getEthKeyPair();
@@ -812,6 +824,7 @@ function getState() {
     initOp,
     sentOp,
     verificationsHashes,
+    verificationsHashesFormat,
     wISchnorrPublic,
     ethSigningAddress: priv2addr(ethPrivateKey),
     naclSigningKey,
@@ -93,7 +93,7 @@ const indexes = [
 
 const variables = [
   { _key: "LAST_DB_UPGRADE_V6", value: -1 },
-  { _key: "VERIFICATIONS_HASHES", hashes: "{}" },
+  { _key: "VERIFICATIONS_HASHES", hashes: "{}", format: 2 },
   { _key: "VERIFICATION_BLOCK", value: 0 },
   // 2021/02/09 as starting point for applying new seed connected
   { _key: "PREV_SNAPSHOT_TIME", value: 1612900000 },
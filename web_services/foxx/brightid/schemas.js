@@ -629,7 +629,12 @@ schemas = Object.assign(
 
     userVerificationsGetResponse: joi.object({
       data: joi.object({
-        verifications: joi.array().items(joi.object()),
+        verifications: joi
+          .array()
+          .items(joi.object())
+          .description(
+            "verifications of the user; the timestamp of a verification is when it was first computed with its current content, not when the returned block was verified"
+          ),
       }),
     }),
 
@@ -762,6 +767,13 @@ schemas = Object.assign(
           .items(joi.object())
           .required()
           .description("different verifications' hashes for last 2 snapshots"),
+        verificationsHashesFormat: joi
+          .number()
+          .integer()
+          .required()
+          .description(
+            "format of verificationsHashes; nodes can only compare hashes of the same format"
+          ),
         wISchnorrPublic: joi
           .string()
           .required()